@@ -0,0 +1,44 @@
+import { type NextRequest, NextResponse } from "next/server"
+
+export async function GET(request: NextRequest) {
+  try {
+    const userId = request.nextUrl.searchParams.get("userId")
+    const period = request.nextUrl.searchParams.get("period") || "month"
+    const authorization = request.headers.get("authorization")
+
+    if (!userId) {
+      return NextResponse.json({ error: "userId is required" }, { status: 400 })
+    }
+    if (!authorization) {
+      return NextResponse.json({ error: "Missing Firebase ID token" }, { status: 401 })
+    }
+
+    // Use environment variable for Python API URL
+    const pythonApiUrl = process.env.PYTHON_API_URL || "http://localhost:5010"
+    const params = new URLSearchParams({ userId, period })
+
+    // Period totals are precomputed by the Python backend, which verifies the
+    // ID token and only answers for the signed-in user
+    const pythonApiResponse = await fetch(`${pythonApiUrl}/analytics/summary?${params}`, {
+      headers: { Authorization: authorization },
+    })
+
+    if (pythonApiResponse.status === 401 || pythonApiResponse.status === 403) {
+      return NextResponse.json(await pythonApiResponse.json(), { status: pythonApiResponse.status })
+    }
+    if (!pythonApiResponse.ok) {
+      const errorText = await pythonApiResponse.text()
+      throw new Error(`Python API responded with status: ${pythonApiResponse.status}, ${errorText}`)
+    }
+
+    const data = await pythonApiResponse.json()
+
+    return NextResponse.json(data)
+  } catch (error) {
+    console.error("Error in analytics API:", error)
+    return NextResponse.json(
+      { error: "Failed to load analytics", details: error instanceof Error ? error.message : String(error) },
+      { status: 500 },
+    )
+  }
+}
@@ -22,6 +22,15 @@ export async function POST(request: NextRequest) {
       body: JSON.stringify({ message, userId }),
     })
 
+    // Pass the backend's "busy, retry later" answer through instead of turning it into a 500
+    if (pythonApiResponse.status === 503) {
+      const busy = await pythonApiResponse.json().catch(() => ({ error: "Assistant is busy" }))
+      return NextResponse.json(busy, {
+        status: 503,
+        headers: { "Retry-After": pythonApiResponse.headers.get("Retry-After") || "1" },
+      })
+    }
+
     if (!pythonApiResponse.ok) {
       const errorText = await pythonApiResponse.text()
       throw new Error(`Python API responded with status: ${pythonApiResponse.status}, ${errorText}`)
@@ -0,0 +1,51 @@
+import { type NextRequest, NextResponse } from "next/server"
+
+export async function POST(request: NextRequest) {
+  try {
+    const body = await request.json()
+    const { message, userId = "anonymous" } = body
+
+    if (!message) {
+      return NextResponse.json({ error: "Message is required" }, { status: 400 })
+    }
+
+    const pythonApiUrl = process.env.PYTHON_API_URL || "http://localhost:5010"
+
+    const pythonApiResponse = await fetch(`${pythonApiUrl}/chat/stream`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ message, userId }),
+    })
+
+    // Pass the backend's "busy, retry later" answer through instead of turning it into a 500
+    if (pythonApiResponse.status === 503) {
+      const busy = await pythonApiResponse.json().catch(() => ({ error: "Assistant is busy" }))
+      return NextResponse.json(busy, {
+        status: 503,
+        headers: { "Retry-After": pythonApiResponse.headers.get("Retry-After") || "1" },
+      })
+    }
+
+    if (!pythonApiResponse.ok || !pythonApiResponse.body) {
+      const errorText = await pythonApiResponse.text()
+      throw new Error(`Python API responded with status: ${pythonApiResponse.status}, ${errorText}`)
+    }
+
+    // Relay the SSE body as-is so chunks reach the browser as soon as they arrive
+    return new Response(pythonApiResponse.body, {
+      headers: {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        Connection: "keep-alive",
+      },
+    })
+  } catch (error) {
+    console.error("Error in chat stream API:", error)
+    return NextResponse.json(
+      { error: "Failed to process request", details: error instanceof Error ? error.message : String(error) },
+      { status: 500 },
+    )
+  }
+}
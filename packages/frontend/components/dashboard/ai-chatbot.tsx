@@ -52,8 +52,8 @@ export function AIChatbot() {
     setIsLoading(true)
 
     try {
-      // Call the API endpoint with authenticated userId
-      const response = await fetch("/api/chat", {
+      // Call the streaming endpoint with authenticated userId
+      const response = await fetch("/api/chat/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -64,24 +64,50 @@ export function AIChatbot() {
         }),
       })
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json().catch(() => ({}))
         const errorMessage = errorData.error || `Server responded with status: ${response.status}`
         throw new Error(errorMessage)
       }
 
-      const data = await response.json()
+      // Show the assistant message as soon as the first chunk arrives and grow it in place
+      const assistantId = (Date.now() + 1).toString()
+      let content = ""
+      const showContent = (text: string) => {
+        setIsLoading(false)
+        setMessages((prev) =>
+          prev.some((message) => message.id === assistantId)
+            ? prev.map((message) => (message.id === assistantId ? { ...message, content: text } : message))
+            : [...prev, { id: assistantId, content: text, role: "assistant" as const, timestamp: new Date() }],
+        )
+      }
 
-      // Create assistant message
-      const assistantMessage: Message = {
-        id: (Date.now() + 1).toString(),
-        content: data.response || "Sorry, I couldn't process your request.",
-        role: "assistant",
-        timestamp: new Date(),
+      // Server-Sent Events: frames are separated by a blank line
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const frames = buffer.split("\n\n")
+        buffer = frames.pop() || ""
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1]
+          const data = frame.match(/^data: (.*)$/m)?.[1]
+          if (!data) continue
+          const payload = JSON.parse(data)
+          if (event === "error") throw new Error(payload.details || payload.error)
+          if (!event && payload.text) {
+            content += payload.text
+            showContent(content)
+          }
+        }
       }
 
-      // Add assistant message to UI
-      setMessages((prev) => [...prev, assistantMessage])
+      if (!content) {
+        showContent("Sorry, I couldn't process your request.")
+      }
     } catch (error) {
       console.error("Error sending message:", error)
 
@@ -4,8 +4,6 @@ import { ArrowDownIcon, ArrowUpIcon, DollarSign, PiggyBank } from "lucide-react"
 import { calculateTotalByType, calculateSavingsRate, formatCurrency } from "@/lib/shared"
 import { Transaction } from "./analytics"
 import { useEffect, useState } from "react"
-import { collection, query, where, orderBy, onSnapshot } from "firebase/firestore"
-import { db } from "@/lib/firebase"
 import { useAuth } from "@/context/auth-context"
 
 interface OverviewStatsProps {
@@ -30,61 +28,40 @@ export function OverviewStats({ isLoading, transactions, period, totalBalance =
   const totalExpenses = calculateTotalByType(transactions, "expense")
   const savingsRate = calculateSavingsRate(totalIncome, totalExpenses)
 
-  // Fetch previous period data for comparison
+  // Fetch previous period data for comparison (precomputed by the Python backend)
   useEffect(() => {
     if (!user) return
 
-    const now = new Date()
-    let startDate = new Date()
-    let endDate = new Date()
+    let cancelled = false
+    setLoadingPrevious(true)
 
-    // Calculate previous period range based on current period
-    if (period === "week") {
-      startDate.setDate(now.getDate() - 14) // 2 weeks ago
-      endDate.setDate(now.getDate() - 7) // 1 week ago
-    } else if (period === "month") {
-      startDate.setMonth(now.getMonth() - 2) // 2 months ago
-      endDate.setMonth(now.getMonth() - 1) // 1 month ago
-    } else if (period === "quarter") {
-      startDate.setMonth(now.getMonth() - 6) // 2 quarters ago
-      endDate.setMonth(now.getMonth() - 3) // 1 quarter ago
-    } else if (period === "year") {
-      startDate.setFullYear(now.getFullYear() - 2) // 2 years ago
-      endDate.setFullYear(now.getFullYear() - 1) // 1 year ago
-    }
-
-    const q = query(
-      collection(db, "transactions"),
-      where("userId", "==", user.uid),
-      where("date", ">=", startDate.toISOString().split("T")[0]),
-      where("date", "<=", endDate.toISOString().split("T")[0]),
-      orderBy("date", "desc")
-    )
-
-    const unsubscribe = onSnapshot(q, (querySnapshot) => {
-      const prevTransactions: Transaction[] = []
-      
-      querySnapshot.forEach((doc) => {
-        prevTransactions.push({
-          id: doc.id,
-          ...(doc.data() as Omit<Transaction, "id">),
+    const params = new URLSearchParams({ userId: user.uid, period })
+    user.getIdToken()
+      .then((token) => fetch(`/api/analytics?${params}`, { headers: { Authorization: `Bearer ${token}` } }))
+      .then((response) => {
+        if (!response.ok) throw new Error(`Server responded with status: ${response.status}`)
+        return response.json()
+      })
+      .then((data) => {
+        if (cancelled) return
+        setPreviousPeriodData({
+          income: data.previous.income,
+          expenses: data.previous.expenses,
+          savings: data.previous.savings_rate,
+          balance: data.previous.balance
         })
       })
-
-      const prevIncome = calculateTotalByType(prevTransactions, "income")
-      const prevExpenses = calculateTotalByType(prevTransactions, "expense")
-      const prevSavings = calculateSavingsRate(prevIncome, prevExpenses)
-
-      setPreviousPeriodData({
-        income: prevIncome,
-        expenses: prevExpenses,
-        savings: prevSavings,
-        balance: prevIncome - prevExpenses
+      .catch((error) => {
+        console.error("Error fetching previous period data:", error)
+        if (!cancelled) setPreviousPeriodData(null)
+      })
+      .finally(() => {
+        if (!cancelled) setLoadingPrevious(false)
       })
-      setLoadingPrevious(false)
-    })
 
-    return () => unsubscribe()
+    return () => {
+      cancelled = true
+    }
   }, [user, period])
 
   // Calculate percentage changes
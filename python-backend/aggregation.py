@@ -0,0 +1,228 @@
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from rollup_cube import DAY, MONTH, WEEK, period_windows
+from transaction_store import from_cents, ordinal_to_iso
+
+TREND_GRANULARITY = {"week": DAY, "month": WEEK, "quarter": WEEK, "year": MONTH}
+
+
+@dataclass
+class FinancialSummary:
+    """Aggregates over one TransactionStore; amounts are int cents"""
+    total_income: int = 0
+    total_expenses: int = 0
+    transaction_count: int = 0
+    active_users: int = 0
+    categories: dict = field(default_factory=dict)  # name -> total cents
+    category_counts: dict = field(default_factory=dict)  # name -> rows
+    recent: list = field(default_factory=list)
+    first_day: int = 0  # day ordinals, 0 when no row has a date
+    last_day: int = 0
+
+    @property
+    def net_balance(self) -> int:
+        return self.total_income - self.total_expenses
+
+    def to_dict(self) -> dict:
+        return {
+            "total_income": from_cents(self.total_income),
+            "total_expenses": from_cents(self.total_expenses),
+            "net_balance": from_cents(self.net_balance),
+            "transaction_count": self.transaction_count,
+            "active_users": self.active_users,
+            "categories": {name: from_cents(total) for name, total in self.categories.items()},
+            "category_counts": dict(self.category_counts),
+            "recent": self.recent,
+            "first_date": ordinal_to_iso(self.first_day),
+            "last_date": ordinal_to_iso(self.last_day),
+        }
+
+
+def grouped_sum(codes, values, groups):
+    """Exact int64 group-by sum (bincount's float64 weights lose cents past 2**53)"""
+    totals = np.zeros(groups, dtype=np.int64)
+    if len(codes):
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        totals[sorted_codes[starts]] = np.add.reduceat(values[order], starts)
+    return totals
+
+
+def summarize(store) -> FinancialSummary:
+    """Snapshot from the store's running aggregates: O(categories x types), plus one
+    row_of() lookup (dict or binary search) per recent row"""
+    agg = store.aggregates
+    agg.settle(store)
+    income_types = {code for code, name in enumerate(store.types.values) if str(name).lower() == "income"}
+    names = store.categories.values
+    summary = FinancialSummary(transaction_count=len(store), active_users=len(agg.user_rows))
+    first, last = None, None
+    for (category, type_), (total, count, lo, hi) in agg.by_category.cells.items():
+        if type_ in income_types:
+            summary.total_income += total
+        else:
+            summary.total_expenses += total
+        name = names[category]
+        summary.categories[name] = summary.categories.get(name, 0) + total
+        summary.category_counts[name] = summary.category_counts.get(name, 0) + count
+        if lo is not None:
+            first = lo if first is None else min(first, lo)
+            last = hi if last is None else max(last, hi)
+    summary.first_day, summary.last_day = first or 0, last or 0
+
+    for day, doc_id in sorted(agg.latest, reverse=True):
+        row = store.row(store.row_of(doc_id))
+        summary.recent.append({key: row[key] for key in ("date", "amount", "category", "type")})
+    return summary
+
+
+def summarize_scan(store, recent=5) -> FinancialSummary:
+    """Same snapshot recomputed from the columns in vectorized passes (no running state)"""
+    n = len(store)
+    amount = store.column("amount")
+    category = store.column("category")
+    day = store.column("day")
+    income = store.income_mask()
+
+    total_income = int(amount[income].sum())
+    cat_counts = np.bincount(category, minlength=len(store.categories))
+    if len(store.categories) and float(np.abs(amount).sum()) < 2 ** 53:
+        cat_totals = np.rint(np.bincount(category, weights=amount, minlength=len(store.categories))).astype(np.int64)
+    else:
+        cat_totals = grouped_sum(category, amount, len(store.categories))
+
+    present = np.flatnonzero(cat_counts)
+    names = store.categories.values
+    known = day[day > 0]
+    summary = FinancialSummary(
+        first_day=int(known.min()) if len(known) else 0,
+        last_day=int(known.max()) if len(known) else 0,
+        total_income=total_income,
+        total_expenses=int(amount.sum()) - total_income,
+        transaction_count=n,
+        active_users=int(np.count_nonzero(np.bincount(store.column("user"), minlength=1))) if n else 0,
+        categories={names[code]: int(cat_totals[code]) for code in present},
+        category_counts={names[code]: int(cat_counts[code]) for code in present},
+    )
+
+    # Rows are unordered, so pick the latest by date
+    k = min(recent, n)
+    if k:
+        latest = np.argpartition(day, n - k)[n - k:]
+        for i in latest[np.argsort(day[latest], kind="stable")[::-1]]:
+            summary.recent.append({
+                "date": ordinal_to_iso(day[i]),
+                "amount": from_cents(amount[i]),
+                "category": names[category[i]],
+                "type": store.types.values[store.type[i]]
+            })
+    return summary
+
+
+def top_categories(categories: dict, limit=None) -> dict:
+    """Largest `limit` categories by absolute total, the rest rolled up into one "Other" entry"""
+    ranked = sorted(categories.items(), key=lambda item: abs(item[1]), reverse=True)
+    if limit is None or len(ranked) <= limit:
+        return dict(ranked)
+    top = dict(ranked[:limit])
+    rest = ranked[limit:]
+    top[f"Other ({len(rest)} categories)"] = sum(total for _, total in rest)
+    return top
+
+
+def render_snapshot(summary: FinancialSummary, categories=None, recent=None, relevant=None) -> str:
+    """Prompt text for the model: compact JSON, optionally capped to the top categories / rows.
+
+    `relevant` rows (retrieved for the query) replace the newest-rows list when given.
+    """
+    data = summary.to_dict()
+    compact = lambda value: json.dumps(value, separators=(",", ":"))
+    totals = {key: data[key] for key in ("total_income", "total_expenses", "net_balance", "active_users")}
+    cells = top_categories(summary.categories, categories)
+    lines = [
+        "Financial Snapshot (amounts in dollars):",
+        compact(totals),
+        f"Categories: {compact({name: from_cents(total) for name, total in cells.items()})}",
+    ]
+    label, rows = ("Relevant Transactions", relevant) if relevant else ("Recent Transactions", data["recent"])
+    rows = rows if recent is None else rows[:recent]
+    if rows:
+        lines.append(f"{label}: {compact(rows)}")
+    return "\n".join(lines)
+
+
+def income_types(store) -> set:
+    return {code for code, name in enumerate(store.types.values) if str(name).lower() == "income"}
+
+
+def cell_totals(store, cells, incomes=None) -> dict:
+    """Income / expense / per-category expense figures from (category, type) -> [total, count] cells"""
+    incomes = income_types(store) if incomes is None else incomes
+    income = expenses = count = 0
+    categories = {}
+    for (category, type_), (total, rows) in cells.items():
+        count += rows
+        if type_ in incomes:
+            income += total
+        else:
+            expenses += total
+            name = store.categories.values[category]
+            categories[name] = categories.get(name, 0) + total
+    return {
+        "income": from_cents(income),
+        "expenses": from_cents(expenses),
+        "balance": from_cents(income - expenses),
+        "savings_rate": round((income - expenses) / income * 100, 2) if income > 0 else 0,
+        "transaction_count": count,
+        "categories": {name: from_cents(total) for name, total in categories.items()},
+    }
+
+
+def percent_change(current, previous):
+    """Same convention as the dashboard: no baseline means no change"""
+    if not previous:
+        return 0
+    return round((current - previous) / previous * 100, 2)
+
+
+def period_report(store, user_id, period, today=None) -> dict:
+    """Current vs previous period figures for one user, from the range index and rollup cube"""
+    aggregates = store.aggregates
+    user = store.users.lookup(user_id)
+    incomes = income_types(store)
+    (start, end), (prev_start, prev_end) = period_windows(period, today)
+
+    def window(lo, hi):
+        cells = aggregates.ranges.totals(store, user, lo, hi) if user is not None else {}
+        return {"start": ordinal_to_iso(lo), "end": ordinal_to_iso(hi), **cell_totals(store, cells, incomes)}
+
+    current, previous = window(start, end), window(prev_start, prev_end)
+    granularity = TREND_GRANULARITY[period]
+    trend = []
+    if user is not None:
+        for bucket, cells in aggregates.series(store, user, granularity, start, end):
+            totals = cell_totals(store, cells, incomes)
+            trend.append({"start": ordinal_to_iso(bucket), "income": totals["income"], "expenses": totals["expenses"]})
+    return {
+        "period": period,
+        "current": current,
+        "previous": previous,
+        "change": {key: percent_change(current[key], previous[key])
+                   for key in ("income", "expenses", "balance", "savings_rate")},
+        "trend_granularity": granularity,
+        "trend": trend,
+    }
+
+
+def range_report(store, user_id, start, end, category=None) -> dict:
+    """Totals for one user over inclusive day ordinals [start, end], via the Fenwick range index"""
+    user = store.users.lookup(user_id)
+    cells = store.aggregates.ranges.totals(store, user, start, end) if user is not None else {}
+    if category is not None:
+        code = store.categories.lookup(category)
+        cells = {key: cell for key, cell in cells.items() if key[0] == code}
+    return {"start": ordinal_to_iso(start), "end": ordinal_to_iso(end), **cell_totals(store, cells)}
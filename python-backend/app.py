@@ -1,13 +1,28 @@
+import hashlib
 import json
-import requests
 import time
 import os
 from datetime import datetime
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import auth, credentials, firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 from dotenv import load_dotenv
+from cache import LRUCache
+from firestore_loader import TRANSACTION_FIELDS, id_range_query, paged_stream, partitioned_stream, headline_totals
+from transaction_store import Snapshot, TransactionStore, day_ordinal, to_cents
+from aggregation import summarize, render_snapshot, period_report, range_report
+from rollup_cube import PERIODS
+from live_listener import TransactionListener, LocalChangeFeed
+from singleflight import SingleFlight
+from gemini_client import GeminiClient
+from prompt_builder import PromptBuilder
+from conversation_memory import ConversationMemory, follow_up
+from upstream_gate import UpstreamGate, UpstreamBusy
+from response_cache import ResponseCache
+from intent_router import route
+import snapshot_file
 
 # Load environment variables
 load_dotenv()
@@ -58,18 +73,188 @@ except Exception as e:
                     # 3- Copy the API Key and paste it in your python-backend environment variables.)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent")
+# Used by /chat/stream; defaults to the streamGenerateContent variant of GEMINI_API_URL
+GEMINI_STREAM_URL = os.getenv("GEMINI_STREAM_URL")
 
 # Validate required environment variables
 if not GEMINI_API_KEY:
     print("⚠️ Warning: GEMINI_API_KEY environment variable is not set")
 
+# Shared Gemini HTTP client: keep-alive connection pool, timeouts (seconds)
+# and jittered retries on 429/5xx
+GEMINI_POOL_MAXSIZE = int(os.getenv("GEMINI_POOL_MAXSIZE", "10"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+# Prompt size budget (estimated tokens) and how much snapshot detail to start
+# from; categories beyond the top N are rolled up into "Other"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+PROMPT_TOP_CATEGORIES = int(os.getenv("PROMPT_TOP_CATEGORIES", "10"))
+PROMPT_RECENT_TRANSACTIONS = int(os.getenv("PROMPT_RECENT_TRANSACTIONS", "5"))
+
+# Per-user conversation memory: verbatim turns and estimated tokens kept per
+# session (older turns are folded into a short summary), how many sessions
+# are kept, and how long an idle session lives (seconds)
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "6"))
+CHAT_MEMORY_TOKENS = int(os.getenv("CHAT_MEMORY_TOKENS", "800"))
+CHAT_MEMORY_SUMMARY_TOKENS = int(os.getenv("CHAT_MEMORY_SUMMARY_TOKENS", "200"))
+CHAT_MEMORY_SESSIONS = int(os.getenv("CHAT_MEMORY_SESSIONS", "1000"))
+CHAT_MEMORY_IDLE_TTL = int(os.getenv("CHAT_MEMORY_IDLE_TTL", "1800"))
+
+# Upstream admission control: requests and estimated tokens per minute (0 = no
+# limit), concurrent calls, and how many callers may wait (and for how many
+# seconds) before /chat answers 503 with Retry-After
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_OUTPUT_TOKENS = int(os.getenv("GEMINI_OUTPUT_TOKENS", "512"))
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "8"))
+GEMINI_QUEUE_SIZE = int(os.getenv("GEMINI_QUEUE_SIZE", "32"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+
+# Transaction loading scope:
+#   "user"   - query only the caller's documents (userId == <caller>, served by
+#              the (userId, date DESC) composite index in firestore.indexes.json)
+#   "global" - stream the whole collection and analyze every user's data
+TRANSACTION_SCOPE = os.getenv("TRANSACTION_SCOPE", "user").lower()
+
+# Per-scope transaction cache: bounded by entry count and bytes, LRU eviction,
+# each entry expiring TRANSACTION_CACHE_TTL seconds after its own refresh
+TRANSACTION_CACHE_TTL = int(os.getenv("TRANSACTION_CACHE_TTL", "300"))
+TRANSACTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSACTION_CACHE_MAX_ENTRIES", "1000"))
+TRANSACTION_CACHE_MAX_BYTES = int(os.getenv("TRANSACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Refresh mode once a cache entry expires:
+#   "incremental" - fetch only documents whose createdAt is at or past the
+#                   entry's high-water mark and merge them in; every
+#                   TRANSACTION_FULL_RESYNC_INTERVAL seconds the result is
+#                   checked against server-side count/sum aggregation queries
+#                   and fully re-downloaded only if they disagree (edits and
+#                   deletes do not move createdAt). The check cannot see
+#                   edits that keep the totals (a new category, date or
+#                   description), so the scope is re-downloaded regardless
+#                   every TRANSACTION_MAX_RESYNC_INTERVAL seconds
+#   "full"        - re-download the whole scope every time
+# TRANSACTION_AGGREGATE_CHECK=false skips the aggregation check and always
+# re-downloads on the resync interval.
+TRANSACTION_REFRESH_MODE = os.getenv("TRANSACTION_REFRESH_MODE", "incremental").lower()
+TRANSACTION_FULL_RESYNC_INTERVAL = int(os.getenv("TRANSACTION_FULL_RESYNC_INTERVAL", "3600"))
+TRANSACTION_MAX_RESYNC_INTERVAL = int(os.getenv("TRANSACTION_MAX_RESYNC_INTERVAL", "86400"))
+TRANSACTION_AGGREGATE_CHECK = os.getenv("TRANSACTION_AGGREGATE_CHECK", "true").lower() in ("1", "true", "yes")
+
+# Firestore reads: documents are fetched in cursor-paged batches of this size
+# (0 = one unbounded stream) with only the fields the store uses. Set
+# TRANSACTION_LOAD_DESCRIPTIONS=false to leave descriptions on the server
+# (retrieval then matches on categories only)
+TRANSACTION_PAGE_SIZE = int(os.getenv("TRANSACTION_PAGE_SIZE", "1000"))
+TRANSACTION_LOAD_DESCRIPTIONS = os.getenv("TRANSACTION_LOAD_DESCRIPTIONS", "true").lower() in ("1", "true", "yes")
+TRANSACTION_SELECT = tuple(f for f in TRANSACTION_FIELDS if TRANSACTION_LOAD_DESCRIPTIONS or f != "description")
+# Full loads of the all-users scope read the collection as this many document id
+# ranges in parallel (1 = one sequential paged scan)
+TRANSACTION_SCAN_PARTITIONS = max(1, int(os.getenv("TRANSACTION_SCAN_PARTITIONS", "4")))
+
+# Only one refresh per scope runs at a time. With stale-while-revalidate on,
+# callers holding an expired snapshot get it back immediately while that
+# refresh runs in the background; otherwise they wait for its result.
+TRANSACTION_STALE_WHILE_REVALIDATE = os.getenv("TRANSACTION_STALE_WHILE_REVALIDATE", "true").lower() in ("1", "true", "yes")
+
+# Set TRANSACTION_SNAPSHOT_DIR to keep each scope's latest snapshot on disk.
+# After a restart the first request for a scope maps that file instead of
+# downloading everything, then catches up with a delta refresh.
+TRANSACTION_SNAPSHOT_DIR = os.getenv("TRANSACTION_SNAPSHOT_DIR")
+# For pre-forked workers (gunicorn/uwsgi) on one host: with
+# TRANSACTION_SNAPSHOT_SHARED=true one worker at a time refreshes a scope under
+# a file lock and publishes the next generation of its snapshot file; the
+# others adopt that generation by mapping the file read-only. What is shared
+# is the column arrays and the packed by_user / by_category tables (held and
+# downloaded once however many workers there are). Each worker still parses
+# its own copy of the document ids and descriptions (tens of bytes per row)
+# and builds search and per-user range indexes for the users it serves, so
+# per-worker memory still grows with the row count, just far more slowly.
+TRANSACTION_SNAPSHOT_SHARED = bool(TRANSACTION_SNAPSHOT_DIR) and os.getenv("TRANSACTION_SNAPSHOT_SHARED", "false").lower() in ("1", "true", "yes")
+
+# How cached transactions are kept current:
+#   "poll"   - refresh on TTL expiry inside the request path (see above)
+#   "listen" - a background snapshot listener on the transactions collection
+#              applies added/modified/removed changes as they happen, so /chat
+#              never waits on Firestore once the initial snapshot has arrived
+TRANSACTION_SYNC = os.getenv("TRANSACTION_SYNC", "poll").lower()
+LISTENER_READY_TIMEOUT = float(os.getenv("LISTENER_READY_TIMEOUT", "10"))
+# Seconds between checks that the listener's watch stream is still running
+LISTENER_CHECK_INTERVAL = float(os.getenv("LISTENER_CHECK_INTERVAL", "5"))
+
+# Model answers cached per (user, normalized query, data fingerprint); set
+# RESPONSE_CACHE_PATH to a file to keep them in SQLite across restarts
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")
+
+# Answer exactly computable questions (category spend, balance, affordability,
+# biggest category) from the local aggregates instead of calling Gemini
+LOCAL_ANSWERS = os.getenv("LOCAL_ANSWERS", "true").lower() in ("1", "true", "yes")
+
+SAMPLE_TRANSACTIONS = [
+    {"amount": 5000, "category": "Salary", "type": "Income", "userId": "user1", "date": "2025-03-30", "description": "Monthly salary"},
+    {"amount": 120, "category": "Food", "type": "Expense", "userId": "user1", "date": "2025-03-29", "description": "Weekly groceries"},
+    {"amount": 200, "category": "Utilities", "type": "Expense", "userId": "user1", "date": "2025-03-28", "description": "Electricity bill"}
+]
+
 class FinancialGeminiAgent:
     def __init__(self):
         self.name = "Advanced Financial Analyst Blink-Bank Ai Agent"
         self.description = "AI assistant analyzing transaction data with enhanced schema and help with General queries"
-        self.conversation_history = []
-        self.transaction_data = []
-        self.last_refresh = None
+        self.memory = ConversationMemory(
+            max_sessions=CHAT_MEMORY_SESSIONS,
+            max_turns=CHAT_MEMORY_TURNS,
+            max_tokens=CHAT_MEMORY_TOKENS,
+            summary_tokens=CHAT_MEMORY_SUMMARY_TOKENS,
+            idle_ttl=CHAT_MEMORY_IDLE_TTL,
+        )
+        self.sample_snapshot = None
+        self.transaction_cache = LRUCache(
+            max_entries=TRANSACTION_CACHE_MAX_ENTRIES,
+            max_bytes=TRANSACTION_CACHE_MAX_BYTES,
+            ttl=TRANSACTION_CACHE_TTL,
+        )
+        self.refresh_flight = SingleFlight()
+        self.snapshot_generations = {}  # scope key -> snapshot file generation last loaded
+        self.snapshot_signatures = {}  # scope key -> (inode, mtime) of the file last checked
+        self.llm_flight = SingleFlight()  # identical prompts in flight share one Gemini call
+        self.llm = GeminiClient(
+            GEMINI_API_URL, GEMINI_API_KEY,
+            stream_url=GEMINI_STREAM_URL,
+            pool_maxsize=GEMINI_POOL_MAXSIZE,
+            connect_timeout=GEMINI_CONNECT_TIMEOUT,
+            read_timeout=GEMINI_READ_TIMEOUT,
+            max_retries=GEMINI_MAX_RETRIES,
+            backoff_base=GEMINI_BACKOFF_BASE,
+            backoff_max=GEMINI_BACKOFF_MAX,
+            gate=UpstreamGate(
+                rpm=GEMINI_RPM,
+                tpm=GEMINI_TPM,
+                max_in_flight=GEMINI_MAX_IN_FLIGHT,
+                max_queue=GEMINI_QUEUE_SIZE,
+                queue_timeout=GEMINI_QUEUE_TIMEOUT,
+            ),
+            output_tokens=GEMINI_OUTPUT_TOKENS,
+        )
+        self.prompts = PromptBuilder(
+            render_snapshot,
+            budget=PROMPT_TOKEN_BUDGET,
+            categories=PROMPT_TOP_CATEGORIES,
+            recent=PROMPT_RECENT_TRANSACTIONS,
+        )
+        self.answer_counts = {"llm": 0}  # intent -> answers served, "llm" for model calls
+        self.response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=RESPONSE_CACHE_MAX_BYTES,
+            ttl=RESPONSE_CACHE_TTL,
+            path=RESPONSE_CACHE_PATH,
+        )
+        self.listener = self._start_listener() if TRANSACTION_SYNC == "listen" else None
         
         self.system_prompt = f"""
         You are {self.name}, analyzing financial transactions with this schema:
@@ -80,103 +265,317 @@ class FinancialGeminiAgent:
         - date: Transaction date (YYYY-MM-DD)
         """
 
-    def refresh_transactions(self):
-        """Fetch latest transactions from Firestore"""
-        if not db:
+    def _scope_key(self, user_id=None):
+        """Cache key for the transactions a caller is allowed to see"""
+        if TRANSACTION_SCOPE == "user" and user_id:
+            return user_id
+        return None
+
+    def _start_listener(self):
+        """Subscribe to live transaction changes (local sample feed without Firebase)"""
+        if db:
+            source = db.collection("transactions")
+        else:
+            source = LocalChangeFeed({str(i): t for i, t in enumerate(SAMPLE_TRANSACTIONS)})
+        listener = TransactionListener(source, key_for=lambda data: self._scope_key(data.get("userId")),
+                                       check_interval=LISTENER_CHECK_INTERVAL)
+        print("👂 Listening for transaction changes")
+        return listener.start()
+
+    def _transactions_query(self, user_id=None):
+        """Build the Firestore query for the configured loading scope"""
+        collection = db.collection("transactions").select(TRANSACTION_SELECT)
+        if self._scope_key(user_id) is None:
+            return collection.order_by("__name__")  # a stable order for page cursors
+        return (collection
+                .where(filter=FieldFilter("userId", "==", user_id))
+                .order_by("date", direction=firestore.Query.DESCENDING))
+
+    def _delta_query(self, user_id, high_water):
+        """Documents created at or after the high-water mark (re-reads are de-duplicated by id)"""
+        query = db.collection("transactions").select(TRANSACTION_SELECT)
+        if self._scope_key(user_id) is not None:
+            query = query.where(filter=FieldFilter("userId", "==", user_id))
+        return (query
+                .where(filter=FieldFilter("createdAt", ">=", high_water))
+                .order_by("createdAt"))
+
+    def _needs_full_sync(self, store):
+        return TRANSACTION_REFRESH_MODE != "incremental" or store.high_water is None
+
+    def _resync_due(self, store):
+        return (time.time() - store.last_checked) > TRANSACTION_FULL_RESYNC_INTERVAL
+
+    def _download_due(self, store):
+        """Whether the scope must be re-downloaded even if the server's totals still match"""
+        return (time.time() - store.last_full_sync) > TRANSACTION_MAX_RESYNC_INTERVAL
+
+    def _scope_query(self, user_id=None):
+        """The scope's documents, unordered and unprojected (for aggregation queries)"""
+        query = db.collection("transactions")
+        if self._scope_key(user_id) is None:
+            return query
+        return query.where(filter=FieldFilter("userId", "==", user_id))
+
+    def _matches_server(self, store, user_id):
+        """Whether the store's headline figures equal Firestore's count/sum aggregations"""
+        incomes = {"income", "Income", "INCOME"} | {t for t in store.types.values if str(t).lower() == "income"}
+        remote = headline_totals(self._scope_query(user_id), incomes)
+        if remote is None:
+            return False
+        local = self.summarize(store)
+        local_total = local.total_income + local.total_expenses
+        income_rows = int(store.income_mask().sum())
+        return (remote["count"] == len(store) and remote["income_count"] == income_rows
+                and abs(to_cents(remote["total"]) - local_total) <= 1
+                and abs(to_cents(remote["income"]) - local.total_income) <= 1)
+
+    def current(self, user_id=None) -> Snapshot:
+        """The caller's scope as an immutable Snapshot, refreshing from Firestore as needed"""
+        key = self._scope_key(user_id)
+        if self.listener is not None:
+            snapshot = self.listener.snapshot(key, timeout=LISTENER_READY_TIMEOUT)
+        elif not db:
             print("⚠️ Firebase not initialized, using sample data")
-            self.transaction_data = [
-                {"amount": 5000, "category": "Salary", "type": "Income", "userId": "user1", "date": "2025-03-30"},
-                {"amount": 120, "category": "Food", "type": "Expense", "userId": "user1", "date": "2025-03-29"},
-                {"amount": 200, "category": "Utilities", "type": "Expense", "userId": "user1", "date": "2025-03-28"}
-            ]
-            self.last_refresh = time.time()
+            snapshot = self._sample_snapshot()
+        else:
+            if TRANSACTION_SNAPSHOT_SHARED:
+                self._adopt_shared(key)
+            snapshot = self.transaction_cache.get(key)
+            if snapshot is None:
+                snapshot = self._refresh(key, user_id)
+            else:
+                # Search and range indexes are built lazily, so re-charge what earlier requests added
+                self.transaction_cache.resize(key, snapshot.store.nbytes)
+        return snapshot
+
+    def refresh_transactions(self, user_id=None):
+        """Fetch latest transactions from Firestore for the caller's scope"""
+        return self.current(user_id).store
+
+    def _refresh(self, key, user_id):
+        # Expired entries stay in the cache until evicted, so they can be caught up
+        entry = self.transaction_cache.peek(key)
+        stale = entry.value if entry is not None else None
+        if stale is None and TRANSACTION_SNAPSHOT_DIR:
+            stale = self.refresh_flight.do(("disk", key), self._disk_snapshot, key)
+            if stale is not None and time.time() - stale.refreshed_at < TRANSACTION_CACHE_TTL:
+                return stale  # saved recently enough to still be fresh
+        load = self._shared_load if TRANSACTION_SNAPSHOT_SHARED else self._load_store
+        try:
+            if stale is not None and TRANSACTION_STALE_WHILE_REVALIDATE:
+                # Serve the previous snapshot; at most one refresh per scope builds the next one
+                self.refresh_flight.do_async(key, load, key, user_id, stale.store)
+                return stale
+            # Concurrent callers for the same scope wait on a single load
+            return self.refresh_flight.do(key, load, key, user_id, stale.store if stale else None)
+        except Exception as e:
+            print(f"⚠️ Error loading transactions: {str(e)}")
+            # Use sample data as fallback
+            return self._sample_snapshot()
+
+    def _sample_snapshot(self):
+        """Sample data never changes, so build it once and keep its version stable"""
+        if self.sample_snapshot is None:
+            self.sample_snapshot = Snapshot.publish(TransactionStore.from_transactions(SAMPLE_TRANSACTIONS))
+        return self.sample_snapshot
+
+    def _snapshot_path(self, key):
+        name = "all-users" if key is None else "user-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(TRANSACTION_SNAPSHOT_DIR, name + ".snap")
+
+    def _disk_snapshot(self, key):
+        """The scope's saved snapshot, cached until its original TTL runs out (None if there is none)"""
+        snapshot, generation = snapshot_file.load(self._snapshot_path(key))
+        if snapshot is None:
+            return None
+        self.snapshot_generations[key] = generation
+        remaining = TRANSACTION_CACHE_TTL - (time.time() - snapshot.refreshed_at)
+        # A negative TTL stores it already expired, so the next refresh is a delta catch-up
+        self.transaction_cache.set(key, snapshot, ttl=remaining or -1, size=snapshot.store.nbytes)
+        print(f"📂 Loaded {len(snapshot.store)} transactions from disk snapshot (generation {generation})")
+        return snapshot
+
+    def _adopt_shared(self, key):
+        """Switch to a newer generation of the scope's file, if another worker published one.
+
+        Costs one stat() when nothing has changed.
+        """
+        path = self._snapshot_path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
             return
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if self.snapshot_signatures.get(key) == signature:
+            return
+        self.snapshot_signatures[key] = signature
+        if snapshot_file.generation(path) > self.snapshot_generations.get(key, 0):
+            self.refresh_flight.do(("disk", key), self._disk_snapshot, key)
 
-        if not self.last_refresh or (time.time() - self.last_refresh) > 300:
-            print("🔄 Refreshing transaction data...")
-            try:
-                docs = db.collection("transactions").stream()
-                self.transaction_data = [doc.to_dict() for doc in docs]
-                self.last_refresh = time.time()
-                print(f"✅ Loaded {len(self.transaction_data)} transactions")
-            except Exception as e:
-                print(f"⚠️ Error loading transactions: {str(e)}")
-                # Use sample data as fallback
-                self.transaction_data = [
-                    {"amount": 5000, "category": "Salary", "type": "Income", "userId": "user1", "date": "2025-03-30"},
-                    {"amount": 120, "category": "Food", "type": "Expense", "userId": "user1", "date": "2025-03-29"},
-                    {"amount": 200, "category": "Utilities", "type": "Expense", "userId": "user1", "date": "2025-03-28"}
-                ]
-
-    def analyze_transactions(self):
-        """Generate enhanced data summary"""
-        summary = {
-            "total_income": 0,
-            "total_expenses": 0,
-            "categories": {},
-            "users": set(),
-            "recent": []
-        }
-
-        for t in self.transaction_data:
-            if t.get('type', '').lower() == 'income':
-                summary["total_income"] += t.get('amount', 0)
+    def _shared_load(self, key, user_id, stale=None):
+        """_load_store under the scope's file lock, so one worker refreshes and the rest adopt its result"""
+        with snapshot_file.locked(self._snapshot_path(key)):
+            self._adopt_shared(key)  # another worker may have published while we waited
+            entry = self.transaction_cache.peek(key)
+            if entry is not None:
+                stale = entry.value.store
+            return self._load_store(key, user_id, stale)
+
+    def _save_snapshot(self, key, snapshot):
+        try:
+            snapshot_file.save(self._snapshot_path(key), snapshot)
+        except Exception as e:
+            print(f"⚠️ Could not save transaction snapshot: {str(e)}")
+
+    def _load_store(self, key, user_id, stale=None):
+        """Full or incremental Firestore load for one scope, published to the cache as a new Snapshot"""
+        entry = self.transaction_cache.peek(key)
+        if entry is not None and not entry.expired:
+            return entry.value  # another caller refreshed it while we were queued
+        scope = 'user ' + key if key else 'all users'
+        store = None
+        if stale is not None and not self._needs_full_sync(stale):
+            print(f"🔄 Fetching new transactions since {stale.high_water} ({scope})...")
+            store = stale.copy()  # readers may still be analyzing the stale one
+            merged = 0
+            for doc in paged_stream(self._delta_query(user_id, store.high_water), TRANSACTION_PAGE_SIZE):
+                version = store.version
+                store.upsert(doc.id, doc.to_dict())
+                merged += store.version != version  # the boundary document is re-read unchanged
+            print(f"✅ Merged {merged} new transactions ({len(store)} total)")
+            if self._resync_due(store):
+                if (TRANSACTION_AGGREGATE_CHECK and not self._download_due(store)
+                        and self._matches_server(store, user_id)):
+                    print(f"✅ Server totals match ({scope}), full resync skipped")
+                    store.last_checked = time.time()
+                else:
+                    store = None
+        if store is None:
+            print(f"🔄 Refreshing transaction data ({scope})...")
+            store = TransactionStore()
+            pages = {}
+            if key is None and TRANSACTION_SCAN_PARTITIONS > 1:
+                collection = db.collection("transactions")
+                docs = partitioned_stream(
+                    lambda lo, hi: id_range_query(collection, TRANSACTION_SELECT, lo, hi),
+                    TRANSACTION_SCAN_PARTITIONS, TRANSACTION_PAGE_SIZE, pages,
+                )
             else:
-                summary["total_expenses"] += t.get('amount', 0)
-            
-            category = t.get('category', 'uncategorized')
-            summary["categories"][category] = summary["categories"].get(category, 0) + t.get('amount', 0)
-            
-            summary["users"].add(t.get('userId', 'unknown'))
-            
-            if len(summary["recent"]) < 5:
-                summary["recent"].append({
-                    "date": t.get('date', 'unknown'),
-                    "amount": t.get('amount', 0),
-                    "category": category,
-                    "type": t.get('type', 'unknown')
-                })
-
-        return f"""
-        Financial Snapshot:
-        - Total Income: ${summary['total_income']}
-        - Total Expenses: ${summary['total_expenses']}
-        - Net Balance: ${summary['total_income'] - summary['total_expenses']}
-        - Top Categories: {json.dumps(summary['categories'], indent=2)}
-        - Active Users: {len(summary['users'])}
-        - Recent Transactions: {json.dumps(summary['recent'], indent=2)}
-        """
+                docs = paged_stream(self._transactions_query(user_id), TRANSACTION_PAGE_SIZE, pages)
+            store.replace_all((doc.id, doc.to_dict()) for doc in docs)  # folds in each page as it arrives
+            print(f"✅ Loaded {len(store)} transactions in {pages.get('pages', 1)} pages")
+        snapshot = Snapshot.publish(store)
+        self.transaction_cache.set(key, snapshot, size=store.nbytes)
+        if TRANSACTION_SNAPSHOT_DIR:
+            self._save_snapshot(key, snapshot)
+        return snapshot
 
-    def generate_response(self, user_input: str, user_id: str = "anonymous") -> str:
-        """Process query with financial analysis"""
-        self.refresh_transactions()
-        data_context = self.analyze_transactions()
-        
-        prompt = f"""
-        {self.system_prompt}
+    def summarize(self, store):
+        """Structured aggregates for the caller's store, recomputed only when it changes.
+
+        There is deliberately no agent-wide default: the store must come from
+        current() for the same caller, or one user could be shown another's data.
+        """
+        return store.derived("summary", summarize)
 
-        Transaction Data Analysis:
+    def analyze_transactions(self, store):
+        """Generate enhanced data summary"""
+        return render_snapshot(self.summarize(store))
 
-        {data_context}
+    def _session(self, user_id):
+        """Conversation history key; anonymous callers share an id, so they get no memory"""
+        return user_id if user_id and user_id != "anonymous" else None
 
-        User ID: {user_id}
-        User Query: {user_input}
+    def _history(self, user_id, user_input) -> str:
+        """Conversation so far, for follow-up questions only.
 
-        ### Expected Response Format:
-        answer as per the response
+        A standalone question is answered (and cached) without the history,
+        so it still hits the response cache mid-conversation; the history
+        changes every turn and would make each key unique.
         """
+        session = self._session(user_id)
+        return self.memory.render(session) if session and follow_up(user_input) else ""
+
+    def _remember(self, user_id, user_input, answer):
+        session = self._session(user_id)
+        if session:
+            self.memory.record(session, user_input, answer)
+
+    def _prepare(self, user_input, user_id, store, history):
+        """(answer, cache_key): a local or cached answer if there is one, else the key to cache under"""
+        local = route(store, user_id, user_input) if LOCAL_ANSWERS else None
+        if local is not None:
+            intent, answer = local
+            self.answer_counts[intent] = self.answer_counts.get(intent, 0) + 1
+            return answer, None
 
+        cache_key = self.response_cache.key(user_id, user_input, store.fingerprint, history)
+        return self.response_cache.get(cache_key), cache_key
+
+    def relevant_transactions(self, store, user_id, query, k=PROMPT_RECENT_TRANSACTIONS) -> list:
+        """The caller's transactions that best match the query (BM25 over description + category)"""
+        user = store.users.lookup(user_id)
+        if user is None:
+            return []
+        rows = [store.row(store.row_of(doc_id)) for doc_id in store.search.search(store, user, query, k)]
+        return [{key: row[key] for key in ("date", "amount", "category", "type", "description")} for row in rows]
+
+    def _build_prompt(self, user_input, user_id, store, history="") -> str:
+        relevant = self.relevant_transactions(store, user_id, user_input)
+        return self.prompts.build(self.system_prompt, self.summarize(store), user_id, user_input, relevant, history)
+
+    def generate_response(self, user_input: str, user_id: str = "anonymous", store=None) -> str:
+        """Process query with financial analysis"""
+        if store is None:
+            store = self.refresh_transactions(user_id)
+        history = self._history(user_id, user_input)
+        answer, cache_key = self._prepare(user_input, user_id, store, history)
+        if answer is not None:
+            self._remember(user_id, user_input, answer)
+            return answer
+
+        prompt = self._build_prompt(user_input, user_id, store, history)
+        prompt_key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
         try:
-            response = requests.post(
-                f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-                headers={"Content-Type": "application/json"},
-                json={"contents": [{"parts": [{"text": prompt}]}]}
-            )
-            response.raise_for_status()
-            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+            answer = self.llm_flight.do(prompt_key, self._call_model, prompt)
+            self.response_cache.set(cache_key, answer)
+            self._remember(user_id, user_input, answer)
+            return answer
+        except UpstreamBusy:
+            raise
         except Exception as e:
             return f"⚠️ Error: {str(e)}"
 
+    def _call_model(self, prompt) -> str:
+        self.answer_counts["llm"] += 1
+        return self.llm.generate(prompt)
+
+    def stream_response(self, user_input: str, user_id: str = "anonymous", store=None):
+        """Like generate_response, but yields the answer in chunks as the model streams it.
+
+        Upstream failures are raised, not yielded as answer text, so a stream
+        that breaks part-way is reported as an error rather than a short answer.
+        """
+        if store is None:
+            store = self.refresh_transactions(user_id)
+        history = self._history(user_id, user_input)
+        answer, cache_key = self._prepare(user_input, user_id, store, history)
+        if answer is not None:
+            self._remember(user_id, user_input, answer)
+            yield answer
+            return
+
+        prompt = self._build_prompt(user_input, user_id, store, history)
+        chunks = []
+        self.answer_counts["llm"] += 1
+        for chunk in self.llm.stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+        answer = "".join(chunks)
+        self.response_cache.set(cache_key, answer)
+        self._remember(user_id, user_input, answer)
+
 # Flask Application
 agent = FinancialGeminiAgent()
 
@@ -184,6 +583,102 @@ agent = FinancialGeminiAgent()
 def home():
     return "Financial Analyst API - POST /chat with {'message': 'your query'}"
 
+@app.route("/stats")
+def stats():
+    return jsonify({
+        "transaction_cache": agent.transaction_cache.stats(),
+        "refresh": agent.refresh_flight.stats(),
+        "llm_coalescing": agent.llm_flight.stats(),
+        "gemini": agent.llm.stats(),
+        "upstream_gate": agent.llm.gate.stats(),
+        "prompt": agent.prompts.stats(),
+        "conversation_memory": agent.memory.stats(),
+        "response_cache": agent.response_cache.stats(),
+        "answers": agent.answer_counts,
+        "listener": agent.listener.stats() if agent.listener else None,
+        "snapshot_files": {
+            "enabled": bool(TRANSACTION_SNAPSHOT_DIR),
+            "shared": TRANSACTION_SNAPSHOT_SHARED,
+            "scopes_loaded": len(agent.snapshot_generations),
+        } if TRANSACTION_SNAPSHOT_DIR else None
+    })
+
+def authenticated_user():
+    """(uid, error response) for the caller's Firebase ID token (Authorization: Bearer <token>).
+
+    Analytics return a user's own figures only, the same rule the Firestore
+    security rules apply to their transactions. Without Firebase there is no
+    real data to protect, so the sample data is served for the userId asked for.
+    """
+    requested = request.args.get("userId")
+    if not db:
+        if not requested:
+            return None, (jsonify({"error": "Missing userId parameter"}), 400)
+        return requested, None
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return None, (jsonify({"error": "Missing Firebase ID token"}), 401)
+    try:
+        uid = auth.verify_id_token(header[len("Bearer "):])["uid"]
+    except Exception as e:
+        return None, (jsonify({"error": "Invalid Firebase ID token", "details": str(e)}), 401)
+    if requested and requested != uid:
+        return None, (jsonify({"error": "userId does not match the signed-in user"}), 403)
+    return uid, None
+
+@app.route("/analytics/summary")
+def analytics_summary():
+    """Current vs previous period totals for the dashboard, answered from the in-memory aggregates"""
+    user_id, error = authenticated_user()
+    if error:
+        return error
+    period = request.args.get("period", "month")
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(PERIODS)}"}), 400
+    try:
+        snapshot = agent.current(user_id)
+        store = snapshot.store
+        report = period_report(store, user_id, period)
+        report["last_updated"] = snapshot.refreshed_at
+        return jsonify(report)
+    except Exception as e:
+        print(f"Error in analytics endpoint: {str(e)}")
+        return jsonify({
+            "error": "Failed to compute analytics",
+            "details": str(e)
+        }), 500
+
+@app.route("/analytics/range")
+def analytics_range():
+    """Income/expense totals between two dates (inclusive), optionally for one category"""
+    user_id, error = authenticated_user()
+    if error:
+        return error
+    start = day_ordinal(request.args.get("start", ""))
+    end = day_ordinal(request.args.get("end", ""))
+    if not start or not end:
+        return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
+    try:
+        snapshot = agent.current(user_id)
+        store = snapshot.store
+        report = range_report(store, user_id, start, end, request.args.get("category"))
+        report["last_updated"] = snapshot.refreshed_at
+        return jsonify(report)
+    except Exception as e:
+        print(f"Error in analytics endpoint: {str(e)}")
+        return jsonify({
+            "error": "Failed to compute analytics",
+            "details": str(e)
+        }), 500
+
+def busy_response(e: UpstreamBusy):
+    """503 telling the client when to retry, instead of queueing behind the upstream limit"""
+    response = jsonify({"error": "Assistant is busy, please retry shortly", "details": str(e),
+                        "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
 @app.route("/chat", methods=["POST"])
 def chat():
     try:
@@ -197,14 +692,19 @@ def chat():
         if not message:
             return jsonify({"error": "Missing message parameter"}), 400
         
-        response = agent.generate_response(message, user_id)
+        snapshot = agent.current(user_id)
+        store = snapshot.store
+        response = agent.generate_response(message, user_id, store=store)
         
         return jsonify({
             "query": message,
             "response": response,
-            "last_updated": agent.last_refresh,
+            "summary": agent.summarize(store).to_dict(),
+            "last_updated": snapshot.refreshed_at,
             "status": "success"
         })
+    except UpstreamBusy as e:
+        return busy_response(e)
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         return jsonify({
@@ -212,6 +712,60 @@ def chat():
             "details": str(e)
         }), 500
 
+def sse(data, event=None) -> str:
+    """One Server-Sent Events frame carrying a JSON payload"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Same as /chat, but relays the answer as SSE `data` frames while the model generates it.
+
+    The final `done` event carries the summary and last_updated fields /chat returns.
+    If the model fails after streaming has started, an `error` event ends the
+    stream instead, and no `done` is sent.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Invalid JSON"}), 400
+    message = data.get("message")
+    user_id = data.get("userId", "anonymous")
+    if not message:
+        return jsonify({"error": "Missing message parameter"}), 400
+
+    # Wait for the first chunk before committing to a 200, so a full upstream queue is a plain 503
+    try:
+        snapshot = agent.current(user_id)
+        store = snapshot.store
+        chunks = agent.stream_response(message, user_id, store=store)
+        first = next(chunks, None)
+    except UpstreamBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"Error in chat stream: {str(e)}")
+        return jsonify({"error": "Failed to process request", "details": str(e)}), 500
+
+    def events():
+        try:
+            if first is not None:
+                yield sse({"text": first})
+            for chunk in chunks:
+                yield sse({"text": chunk})
+            yield sse({
+                "query": message,
+                "summary": agent.summarize(store).to_dict(),
+                "last_updated": snapshot.refreshed_at,
+                "status": "success"
+            }, event="done")
+        except Exception as e:
+            print(f"Error in chat stream: {str(e)}")
+            yield sse({"error": "Failed to process request", "details": str(e)}, event="error")
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # keep reverse proxies from buffering the stream
+    })
+
 if __name__ == "__main__":
     print("🚀 Starting Financial Analyst API on port 5010")
     app.run(port=5010, debug=True)
\ No newline at end of file
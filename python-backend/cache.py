@@ -0,0 +1,145 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value) -> int:
+    """Rough in-memory footprint of a cached value in bytes"""
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item) if isinstance(item, (dict, list, tuple)) else sys.getsizeof(item)
+    return size
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "stored_at", "expires_at")
+
+    def __init__(self, value, size, stored_at, expires_at):
+        self.value = value
+        self.size = size
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and bytes, with per-entry TTL"""
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None, sizeof=estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and not entry.expired
+
+    def get(self, key, default=None):
+        """Return a live value and mark it most recently used.
+
+        Expired entries count as misses but are kept (until evicted or replaced)
+        so callers can still peek() at them to catch up incrementally.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry.expired:
+                self.misses += 1
+                self.expirations += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def peek(self, key):
+        """Return the raw entry (even if expired) without touching stats or LRU order"""
+        return self._entries.get(key)
+
+    def set(self, key, value, ttl=None, size=None):
+        """Insert or replace a value; ttl overrides the cache default for this entry"""
+        ttl = self.ttl if ttl is None else ttl
+        size = self.sizeof(value) if size is None else size
+        now = time.time()
+        entry = CacheEntry(value, size, now, now + ttl if ttl else None)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Would evict everything else and still not fit
+                self.evictions += 1
+                return False
+            self._entries[key] = entry
+            self._bytes += size
+            self._evict()
+        return True
+
+    def resize(self, key, size):
+        """Re-charge a live entry whose value has grown or shrunk since it was set"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.size == size:
+                return
+            self._bytes += size - entry.size
+            entry.size = size
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
@@ -0,0 +1,110 @@
+import re
+import threading
+from collections import deque
+
+from cache import LRUCache
+from prompt_builder import estimate_tokens, truncate_tokens
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s")
+# Words that point back at earlier turns ("what about food?", "why is that?");
+# "this"/"that" before a time unit ("this month") are a date, not a reference
+_FOLLOW_UP = re.compile(
+    r"^(and|but|so|also|then|ok|okay)\b|\b(it|its|that|this|those|these|they|them|there|above|previous\w*|"
+    r"earlier|again|also|too|instead|same|else|what about|how about|more detail\w*|expand|elaborate|you said|"
+    r"you mentioned)\b(?! (day|week|month|quarter|year)s?\b)"
+)
+
+
+class Session:
+    """One user's recent turns plus a rolling summary of the older ones"""
+
+    __slots__ = ("turns", "summary", "tokens")
+
+    def __init__(self):
+        self.turns = deque()  # (question, answer, tokens)
+        self.summary = deque()  # one short line per folded turn, oldest first
+        self.tokens = 0  # turns + summary
+
+    def render(self) -> str:
+        lines = []
+        if self.summary:
+            lines.append("Earlier in this conversation:")
+            lines.extend(f"- {line}" for line in self.summary)
+        for question, answer, _ in self.turns:
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines)
+
+
+def follow_up(question) -> bool:
+    """Whether a question refers back to the conversation, so its answer depends on the history"""
+    return bool(_FOLLOW_UP.search(question.lower().strip()))
+
+
+def digest(question, answer, tokens=40) -> str:
+    """Extractive one-line summary of a turn: the question and the answer's first sentence"""
+    first = _SENTENCE.split(answer.strip(), maxsplit=1)[0]
+    line = f"asked \"{question.strip()}\"; answered: {first}"
+    return truncate_tokens(line, tokens)
+
+
+class ConversationMemory:
+    """Per-user chat history for multi-turn prompts, bounded in every dimension.
+
+    Each session keeps at most `max_turns` verbatim turns and `max_tokens`
+    estimated tokens; older turns are folded into one-line digests, and the
+    digests themselves are capped at `summary_tokens` (oldest dropped first).
+    Sessions live in an LRU cache, so idle ones expire after `idle_ttl`
+    seconds and the least recently used go once `max_sessions` is reached.
+    Folding is extractive and local, so it costs no model call.
+    """
+
+    def __init__(self, max_sessions=1000, max_turns=6, max_tokens=800, summary_tokens=200, idle_ttl=1800):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.sessions = LRUCache(max_entries=max_sessions, ttl=idle_ttl)
+        self._lock = threading.Lock()
+        self.folded = 0
+
+    def render(self, user_id) -> str:
+        """History text for the prompt ("" for a new or expired session)"""
+        session = self.sessions.get(user_id)
+        if session is None:
+            return ""
+        with self._lock:
+            return session.render()
+
+    def record(self, user_id, question, answer):
+        with self._lock:
+            session = self.sessions.get(user_id)
+            if session is None:
+                session = Session()
+            tokens = estimate_tokens(question) + estimate_tokens(answer)
+            session.turns.append((question, answer, tokens))
+            session.tokens += tokens
+            while session.turns and (len(session.turns) > self.max_turns or session.tokens > self.max_tokens):
+                self._fold(session)
+            # Re-set to refresh the idle TTL and the size the cache accounts for
+            self.sessions.set(user_id, session, size=session.tokens * 4)
+
+    def clear(self, user_id):
+        self.sessions.delete(user_id)
+
+    def stats(self) -> dict:
+        stats = self.sessions.stats()
+        stats["folded_turns"] = self.folded
+        return stats
+
+    def _fold(self, session):
+        question, answer, tokens = session.turns.popleft()
+        session.tokens -= tokens
+        line = digest(question, answer)
+        session.summary.append(line)
+        session.tokens += estimate_tokens(line)
+        self.folded += 1
+        summary = sum(estimate_tokens(line) for line in session.summary)
+        while session.summary and summary > self.summary_tokens:
+            dropped = estimate_tokens(session.summary.popleft())
+            summary -= dropped
+            session.tokens -= dropped
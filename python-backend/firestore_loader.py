@@ -0,0 +1,138 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+# Fields TransactionStore reads from a transaction document; everything else
+# is left on the server by select()
+TRANSACTION_FIELDS = ("amount", "category", "type", "userId", "date", "description", "createdAt")
+
+
+def paged_stream(query, page_size, stats=None):
+    """Yield a query's documents in cursor-paged batches of `page_size`.
+
+    Each page is a separate `limit().start_after()` request, so at most one
+    page of documents is in flight and the caller can fold each document in
+    before the next page is fetched. The query must have a stable order (the
+    last document of a page is the cursor). A page_size of 0 streams the
+    query in one request.
+    """
+    if not page_size:
+        yield from query.stream()
+        return
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        count = 0
+        for doc in page.stream():
+            count += 1
+            last = doc
+            yield doc
+        if stats is not None:
+            stats["pages"] = stats.get("pages", 0) + 1
+        if count < page_size:
+            return
+
+
+def headline_totals(query, income_types):
+    """Server-side (count, total, income count, income total) for a query via aggregation queries.
+
+    Two aggregation reads instead of one read per document. Returns None when
+    the backend or client library cannot run sum/count aggregations (older
+    google-cloud-firestore, some emulators, test doubles), so callers fall
+    back to reading the documents and computing the figures locally.
+    """
+    def run(q):
+        result = q.count(alias="count").sum("amount", alias="total").get()
+        values = {item.alias: item.value for item in result[0]}
+        return int(values["count"]), values["total"] or 0
+
+    try:
+        count, total = run(query)
+        income_count, income = run(query.where(filter=FieldFilter("type", "in", sorted(income_types))))
+    except Exception as e:
+        print(f"⚠️ Aggregation query unavailable, falling back to document reads: {str(e)}")
+        return None
+    return {"count": count, "total": total, "income_count": income_count, "income": income}
+
+
+# Firestore auto-generated document ids are 20 characters drawn uniformly from
+# this alphabet, so splitting on the first character gives even partitions
+AUTO_ID_ALPHABET = "".join(sorted("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"))
+
+
+def id_ranges(partitions) -> list:
+    """[(lo, hi)] document id ranges covering every id; None means unbounded"""
+    step = len(AUTO_ID_ALPHABET) / partitions
+    bounds = [AUTO_ID_ALPHABET[round(i * step)] for i in range(1, partitions)]
+    edges = [None] + bounds + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def id_range_query(collection, fields, lo, hi):
+    """Documents with lo <= id < hi, in id order (so pages can use cursors)"""
+    query = collection.select(fields)
+    if lo is not None:
+        query = query.where(filter=FieldFilter("__name__", ">=", collection.document(lo)))
+    if hi is not None:
+        query = query.where(filter=FieldFilter("__name__", "<", collection.document(hi)))
+    return query.order_by("__name__")
+
+
+def partitioned_stream(query_for_range, partitions, page_size, stats=None):
+    """Yield documents from `partitions` id ranges read concurrently on a thread pool.
+
+    Workers hand over whole pages through a bounded queue, so at most about
+    two pages per partition are held while the caller folds documents in on
+    its own thread. Documents arrive in no particular order.
+    """
+    batch_size = page_size or 500
+    pages = queue.Queue(maxsize=partitions * 2)
+    cancel = threading.Event()
+    done = object()
+
+    def put(item):
+        while not cancel.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def scan(lo, hi):
+        try:
+            batch = []
+            for doc in paged_stream(query_for_range(lo, hi), page_size):
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    with ThreadPoolExecutor(max_workers=partitions, thread_name_prefix="scan") as pool:
+        for lo, hi in id_ranges(partitions):
+            pool.submit(scan, lo, hi)
+        remaining = partitions
+        try:
+            while remaining:
+                item = pages.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    if stats is not None:
+                        stats["pages"] = stats.get("pages", 0) + 1
+                    yield from item
+        finally:
+            cancel.set()  # unblock workers if we stopped early
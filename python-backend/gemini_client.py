@@ -0,0 +1,167 @@
+import contextlib
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from prompt_builder import estimate_tokens
+from upstream_gate import UpstreamBusy
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Upstream call failed after all retries"""
+
+
+class GeminiClient:
+    """Shared keep-alive HTTP client for the Gemini REST API.
+
+    One requests.Session with a bounded urllib3 pool is reused for every chat
+    turn, so only the first request to a host pays for TCP + TLS setup.
+    429/5xx responses and connection errors are retried with full-jitter
+    exponential backoff (or the server's Retry-After); with a gate, each
+    retry takes its own request and tokens from the rate buckets first.
+    """
+
+    def __init__(self, api_url, api_key, stream_url=None, pool_maxsize=10, connect_timeout=5.0, read_timeout=60.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, gate=None, output_tokens=512):
+        self.api_url = api_url
+        self.stream_url = stream_url or api_url.replace(":generateContent", ":streamGenerateContent")
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.gate = gate  # optional UpstreamGate every call must pass
+        self.output_tokens = output_tokens  # expected answer size, charged to the TPM budget up front
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=True, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        if api_key:
+            # A header rather than ?key=, so the key never appears in URLs quoted by errors or logs
+            self.session.headers["x-goog-api-key"] = api_key
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def post(self, url, payload, stream=False, params=None, tokens=0):
+        """POST with retries; returns the successful Response. `tokens` is charged to the gate per retry"""
+        params = dict(params or {})
+        attempt = 0
+        while True:
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.session.post(url, params=params, json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._failed()
+                    raise GeminiError(str(e)) from e
+                self._backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    if not response.ok:
+                        self._failed()
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                self._backoff(attempt, retry_after)
+            if self.gate is not None:
+                try:
+                    self.gate.charge(tokens)
+                except UpstreamBusy:
+                    self._failed()
+                    raise
+            attempt += 1
+
+    def generate(self, prompt: str) -> str:
+        """Single-shot generateContent call; returns the first candidate's text"""
+        tokens = self._estimate(prompt)
+        with self._admitted(tokens):
+            response = self.post(self.api_url, {"contents": [{"parts": [{"text": prompt}]}]}, tokens=tokens)
+            try:
+                text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+            except (KeyError, IndexError, ValueError):
+                text = ""
+            if not text:
+                self._failed()
+                raise GeminiError("Gemini returned no text (the answer may have been blocked)")
+            return text
+
+    def stream(self, prompt: str):
+        """streamGenerateContent over SSE; yields text chunks as the model produces them.
+
+        Retries only cover getting the stream started; once chunks have been
+        yielded a broken connection is raised to the caller. A stream that
+        ends without any text (e.g. a blocked candidate) raises GeminiError,
+        like generate().
+        """
+        tokens = self._estimate(prompt)
+        with self._admitted(tokens):
+            empty = True
+            for chunk in self._stream(prompt, tokens):
+                empty = False
+                yield chunk
+            if empty:
+                self._failed()
+                raise GeminiError("Gemini returned no text (the answer may have been blocked)")
+
+    def _stream(self, prompt, tokens):
+        response = self.post(self.stream_url, {"contents": [{"parts": [{"text": prompt}]}]},
+                             stream=True, params={"alt": "sse"}, tokens=tokens)
+        response.encoding = "utf-8"  # SSE is always UTF-8; without a charset requests would assume ISO-8859-1
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                for candidate in event.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+
+    def stats(self) -> dict:
+        pools = self.adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        connections = sum(pool.num_connections for pool in pools)
+        sent = sum(pool.num_requests for pool in pools)
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "connections_opened": connections,
+            "connection_reuse_rate": round(1 - connections / sent, 4) if sent else None,
+            "pool_maxsize": self.adapter._pool_maxsize,
+        }
+
+    def _estimate(self, prompt) -> int:
+        """Tokens one call is charged against the TPM budget: the prompt plus the expected answer"""
+        return estimate_tokens(prompt) + self.output_tokens
+
+    def _admitted(self, tokens):
+        """Gate slot for one call (a no-op context when there is no gate)"""
+        if self.gate is None:
+            return contextlib.nullcontext()
+        return self.gate.slot(tokens)
+
+    def _failed(self):
+        with self._lock:
+            self.failures += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        with self._lock:
+            self.retries += 1
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        time.sleep(min(delay, self.backoff_max))
@@ -0,0 +1,247 @@
+import re
+from datetime import date
+
+from aggregation import income_types
+from rollup_cube import month_bounds, shift_months, week_key
+from transaction_store import day_ordinal, from_cents, to_cents
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+# Advice, planning and "why" questions need the model even when they mention a figure
+OPEN_ENDED = re.compile(
+    r"\b(why|should|advice|advise|tips?|suggest\w*|recommend\w*|help me|how (can|could|do|to)|"
+    r"plan\w*|improve|reduce|cut|save more|budget\w*|invest\w*|compare|explain)\b"
+)
+# Counting, averaging, share and comparison questions need more than the single total we would give
+UNSUPPORTED = re.compile(
+    r"\b(how many|count\w*|number of|times|average\w*|avg|mean|median|typical\w*|per|daily|weekly|monthly|"
+    r"yearly|percent\w*|ratio|share|proportion|fraction|vs|versus|compar\w*|than|more|less|fewer|differ\w*|"
+    r"each|every|breakdown|trend\w*|transactions?)\b|%"
+)
+AMOUNT = re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)|(\d[\d,]*(?:\.\d+)?)\s?(?:dollars|usd|bucks)\b")
+ISO_DATE = r"(\d{4}-\d{2}-\d{2})"
+MONTH_NAME = r"(" + "|".join(MONTHS + [m[:3] for m in MONTHS]) + r")"
+# Date-like words still in the query once the parsed date phrase is taken out
+# mean a date we could not read ("on March 3"), so the all-time figure would be wrong
+DATE_WORD = re.compile(
+    r"\d|\b(" + "|".join(m for m in MONTHS + [m[:3] for m in MONTHS] if m != "may") + r"|sept|"
+    r"(mon|tues|wednes|thurs|fri|satur|sun)days?|weekends?|days?|weeks?|months?|years?|quarters?|q[1-4]|ytd|"
+    r"tomorrow|tonight|morning|evening|ago|since|before|after|until|till|between|during|last|past|next|"
+    r"recent\w*|lately|annual\w*)\b"
+)
+
+# Every word of a locally answered question must come from FILLER or its
+# intent's own words (category names, dates and amounts are taken out first);
+# anything else means the question asks for something the template does not.
+FILLER = frozenset("""
+how much what whats is was are were did do does have has had i ive im s ve m my me in on for of to the a an
+so far total overall altogether currently right now all money please tell show
+""".split())
+SELF = frozenset(("i", "ive", "im", "my", "me"))
+INTENT_WORDS = {
+    "afford": frozenset("can could afford buy purchase get new this that it".split()),
+    "top_category": frozenset(
+        "biggest largest top highest most category categories spend spent spending expense expenses which where".split()),
+    "spend": frozenset("spend spent spending expense expenses paid".split()),
+    "income": frozenset("earn earned earnings income made received receive from get got".split()),
+    "balance": frozenset("balance net left over".split()),
+}
+AFFORD_ITEM_WORDS = 3  # "a $900 used road bike"
+
+
+def money(cents) -> str:
+    return f"${from_cents(cents):,.2f}" if cents >= 0 else f"-${from_cents(-cents):,.2f}"
+
+
+def date_window(text, today=None):
+    """(start, end, label, span) for a date phrase in the query, or None for all time.
+
+    start and end are inclusive day ordinals; span is where the phrase sits in
+    `text`, so the caller can check what else the query says.
+    """
+    today = today or date.today()
+    t = today.toordinal()
+    match = re.search(rf"\b(?:between|from) {ISO_DATE} (?:and|to|until) {ISO_DATE}\b", text)
+    if match:
+        start, end = day_ordinal(match.group(1)), day_ordinal(match.group(2))
+        if start and end and start <= end:
+            return start, end, f"between {match.group(1)} and {match.group(2)}", match.span()
+    match = re.search(rf"\bsince {ISO_DATE}\b", text)
+    if match and day_ordinal(match.group(1)):
+        return day_ordinal(match.group(1)), t, f"since {match.group(1)}", match.span()
+    match = re.search(r"\b(?:in the |over the )?(?:last|past) (\d+) days?\b", text)
+    if match:
+        days = max(int(match.group(1)), 1)
+        return t - days + 1, t, f"in the last {days} days", match.span()
+    match = re.search(rf"\b(?:in|during) {MONTH_NAME}(?: (\d{{4}}))?\b", text)
+    if match:
+        month = [m[:3] for m in MONTHS].index(match.group(1)[:3]) + 1
+        year = int(match.group(2)) if match.group(2) else today.year - (month > today.month)
+        start, end = month_bounds(year * 12 + month - 1)
+        return start, min(end, t), f"in {MONTHS[month - 1].title()} {year}", match.span()
+    match = re.search(r"\btoday\b", text)
+    if match:
+        return t, t, "today", match.span()
+    match = re.search(r"\byesterday\b", text)
+    if match:
+        return t - 1, t - 1, "yesterday", match.span()
+    match = re.search(r"\b(?:in |during |for )?(this|last) (week|month|year)\b", text)
+    if match:
+        which, unit = match.groups()
+        if unit == "week":
+            start = week_key(t)
+            window = (start, t) if which == "this" else (start - 7, start - 1)
+        elif unit == "month":
+            first = today.replace(day=1)
+            if which == "this":
+                window = (first.toordinal(), t)
+            else:
+                window = (shift_months(first, -1).toordinal(), first.toordinal() - 1)
+        else:
+            year = today.year if which == "this" else today.year - 1
+            window = (date(year, 1, 1).toordinal(), min(date(year, 12, 31).toordinal(), t))
+        return window[0], window[1], f"{which} {unit}", match.span()
+    return None
+
+
+def find_categories(store, text) -> dict:
+    """{category: span} for every category named in the query (singular or plural).
+
+    A name inside a longer matched name ("food" in "fast food") is not
+    counted separately.
+    """
+    found = {}
+    for name in store.categories.values:
+        label = str(name).lower().strip()
+        if not label:
+            continue
+        stem = re.escape(label[:-1] if label.endswith("s") else label)
+        match = re.search(rf"\b{stem}(s|es)?\b", text)
+        if match:
+            found[name] = match.span()
+    return {name: span for name, span in found.items()
+            if not any(other != name and o[0] <= span[0] and span[1] <= o[1] and o != span
+                       for other, o in found.items())}
+
+
+def find_amount(text):
+    """(cents, span) of the first dollar amount in the query, or None"""
+    match = AMOUNT.search(text)
+    if not match:
+        return None
+    return to_cents((match.group(1) or match.group(2)).replace(",", "")), match.span()
+
+
+def user_cells(store, user, window=None) -> dict:
+    """(category, type) -> [total_cents, count] for one user, all time or over a day window"""
+    if window is not None:
+        return store.aggregates.ranges.totals(store, user, window[0], window[1])
+    return {key: [total, count] for key, (total, count, _, _) in store.aggregates.by_user.group(user).items()}
+
+
+def split_totals(store, cells):
+    """(income_cents, expense_cents, {category: expense_cents}, {category: income_cents})"""
+    incomes = income_types(store)
+    income = expenses = 0
+    spent, earned = {}, {}
+    for (category, type_), (total, _) in cells.items():
+        name = store.categories.values[category]
+        if type_ in incomes:
+            income += total
+            earned[name] = earned.get(name, 0) + total
+        else:
+            expenses += total
+            spent[name] = spent.get(name, 0) + total
+    return income, expenses, spent, earned
+
+
+def leftover_words(text, spans) -> list:
+    """Words of `text` outside the given (start, end) spans"""
+    for start, end in sorted(spans, reverse=True):
+        text = text[:start] + " " + text[end:]
+    return re.findall(r"[a-z]+|\d+", text)
+
+
+def fits(words, intent, extra=0) -> bool:
+    """Whether the leftover words are a plain question about the caller for `intent`"""
+    allowed = FILLER | INTENT_WORDS[intent]
+    return bool(SELF.intersection(words)) and sum(word not in allowed for word in words) <= extra
+
+
+def route(store, user_id, query, today=None):
+    """(intent, answer) for questions the aggregates answer exactly, or None to ask the model.
+
+    Only questions that are nothing but a known template (one figure, for at
+    most one category, over a date phrase we parsed) are answered here;
+    everything else, including anything we only half understand, goes to the model.
+    """
+    text = re.sub(r"[^\w\s$.,-]", " ", query.lower())
+    text = re.sub(r"\s+", " ", text).strip()
+    if not text or OPEN_ENDED.search(text) or UNSUPPORTED.search(text):
+        return None
+    user = store.users.lookup(user_id)
+    if user is None or user not in store.aggregates.user_rows:
+        return None
+
+    window = date_window(text, today)
+    spans = [window[3]] if window else []
+    amount = find_amount(text)
+    if amount is not None:
+        spans.append(amount[1])
+    categories = find_categories(store, text)
+    words = leftover_words(text, spans + list(categories.values()))
+    if DATE_WORD.search(" ".join(words)):
+        return None
+
+    period = f" {window[2]}" if window else ""
+    cells = user_cells(store, user, window[:2] if window else None)
+    income, expenses, spent, earned = split_totals(store, cells)
+
+    if "afford" in words:
+        words = leftover_words(text, spans)  # the item may well contain a category name
+        if amount is None or not fits(words, "afford", AFFORD_ITEM_WORDS):
+            return None
+        amount = amount[0]
+        if window is not None:
+            income, expenses, _, _ = split_totals(store, user_cells(store, user))
+        balance = income - expenses
+        if balance > amount * 3:
+            return "afford", (f"Yes, you can afford a {money(amount)} purchase. "
+                              f"You have approximately {money(balance)} available.")
+        return "afford", (f"A {money(amount)} purchase might be tight right now. "
+                          f"You have approximately {money(balance)} available.")
+    if amount is not None or len(categories) > 1:
+        return None
+    category = next(iter(categories), None)
+
+    if re.search(r"\b(biggest|largest|top|highest|most)\b", text) and re.search(r"\b(categor\w*|spend\w*|spent|expense\w*)\b", text):
+        if category is not None or not fits(words, "top_category"):
+            return None
+        if not spent:
+            return "top_category", f"You have no expenses recorded{period}."
+        name, total = max(spent.items(), key=lambda item: item[1])
+        share = round(total / expenses * 100, 1) if expenses > 0 else 0
+        return "top_category", (f"Your biggest spending category{period} is {name} at {money(total)}, "
+                                f"{share}% of your {money(expenses)} in expenses.")
+
+    if re.search(r"\b(spend|spent|spending|expenses?|paid)\b", text):
+        if not fits(words, "spend"):
+            return None
+        if category is not None:
+            return "category_spend", f"You've spent {money(spent.get(category, 0))} on {category}{period}."
+        return "total_spend", f"You've spent {money(expenses)} in total{period}."
+
+    if re.search(r"\b(earn|earned|earnings|income|made|received)\b", text):
+        if not fits(words, "income"):
+            return None
+        if category is not None:
+            return "category_income", f"You've received {money(earned.get(category, 0))} from {category}{period}."
+        return "total_income", f"Your income{period} is {money(income)}."
+
+    if re.search(r"\b(balance|net|left over|how much (money )?do i have)\b", text):
+        if category is not None or not fits(words, "balance"):
+            return None
+        return "balance", (f"Your net balance{period} is {money(income - expenses)} "
+                           f"({money(income)} income, {money(expenses)} expenses).")
+    return None
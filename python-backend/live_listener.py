@@ -0,0 +1,198 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from transaction_store import Snapshot, TransactionStore
+
+_GONE = object()  # staged owner for a document removed in this batch
+
+
+class TransactionListener:
+    """Keeps in-process TransactionStores current from a snapshot listener.
+
+    `source` is anything with Firestore's `on_snapshot(callback)` contract:
+    the transactions collection in production, or a LocalChangeFeed.
+    `key_for` maps a document's data to the store (cache scope) it belongs to.
+
+    Published stores are never modified: each change batch copies the stores
+    it touches, applies the changes to the copies and stages document
+    ownership changes, then swaps in a new `snapshots` dict and commits the
+    ownership together, so readers get a consistent Snapshot without locking
+    and a failed batch leaves nothing half-applied.
+
+    Firestore's Python watch has no error callback, so a supervisor thread
+    checks it every `check_interval` seconds. If it has stopped (or a batch
+    could not be applied) it subscribes again, and the fresh initial listing
+    replaces every store, so deletes missed while disconnected are dropped.
+    """
+
+    def __init__(self, source, key_for=lambda data: None, check_interval=5.0):
+        self.source = source
+        self.key_for = key_for
+        self.check_interval = check_interval
+        self.snapshots = {}  # scope key -> Snapshot; replaced wholesale, never mutated
+        self.ready = threading.Event()
+        self.changes_applied = 0
+        self.last_event_at = None
+        self.restarts = 0
+        self._owner = {}  # doc id -> store key, so re-keyed or removed docs find their store
+        self._lock = threading.Lock()
+        self._watch = None
+        self._reset = False  # the next batch is a full listing that replaces every store
+        self._broken = False  # a batch failed, so the stores may have missed changes
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._watch = self.source.on_snapshot(self._on_snapshot)
+        threading.Thread(target=self._supervise, name="listener-supervisor", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    @property
+    def active(self) -> bool:
+        return self._watch is not None and not self._broken and getattr(self._watch, "is_active", True)
+
+    def snapshot(self, key, timeout=None):
+        """A scope's current Snapshot; waits for the initial listener snapshot at most `timeout` seconds"""
+        if not self.ready.is_set():
+            self.ready.wait(timeout)
+        snapshot = self.snapshots.get(key)
+        return snapshot if snapshot is not None else Snapshot(TransactionStore(), self.last_event_at)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready.is_set(),
+            "scopes": len(self.snapshots),
+            "documents": len(self._owner),
+            "changes_applied": self.changes_applied,
+            "last_event_at": self.last_event_at,
+            "active": self.active,
+            "restarts": self.restarts,
+        }
+
+    def _supervise(self):
+        while not self._stopped.wait(self.check_interval):
+            if self._watch is not None and not self.active:
+                self._restart()
+
+    def _restart(self):
+        print("⚠️ Transaction listener stopped, subscribing again")
+        try:
+            self._watch.unsubscribe()
+        except Exception:
+            pass  # already closed
+        with self._lock:
+            self._reset = True
+            self._broken = False
+        self.restarts += 1
+        try:
+            self._watch = self.source.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f"⚠️ Could not subscribe to transaction changes: {str(e)}")  # retried on the next check
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            with self._lock:  # serializes writers only
+                reset = self._reset
+                working = {}  # scope key -> private copy being changed in this batch
+                owners = {}  # doc id -> scope key (or _GONE), committed with the snapshots
+                for change in changes:
+                    self._apply(change.type.name, change.document, working, owners, reset)
+                now = time.time()
+                published = {} if reset else dict(self.snapshots)
+                published.update({key: Snapshot.publish(store, now) for key, store in working.items()})
+                if reset:
+                    self._owner = {}
+                for doc_id, key in owners.items():
+                    if key is _GONE:
+                        self._owner.pop(doc_id, None)
+                    else:
+                        self._owner[doc_id] = key
+                self.snapshots = published
+                self._reset = False
+                self.changes_applied += len(changes)
+                self.last_event_at = now
+            self.ready.set()
+        except Exception as e:
+            print(f"⚠️ Error applying transaction changes: {str(e)}")
+            self._broken = True  # the supervisor re-subscribes for a full listing
+
+    def _working(self, key, working, reset):
+        """This batch's writable copy of a scope's store"""
+        store = working.get(key)
+        if store is None:
+            current = None if reset else self.snapshots.get(key)
+            store = working[key] = current.store.copy() if current is not None else TransactionStore()
+        return store
+
+    def _apply(self, kind, document, working, owners, reset):
+        doc_id = document.id
+        previous = owners.get(doc_id, _GONE if reset else self._owner.get(doc_id, _GONE))
+        if previous is not _GONE:
+            self._working(previous, working, reset).remove(doc_id)
+            owners[doc_id] = _GONE
+        if kind == "REMOVED":
+            return
+        data = document.to_dict()
+        key = self.key_for(data)
+        self._working(key, working, reset).upsert(doc_id, data)
+        owners[doc_id] = key
+
+
+class LocalChangeFeed:
+    """In-process stand-in for a Firestore collection's change stream.
+
+    Used when Firebase is not configured (seeded with sample data) and as a
+    deterministic feed for exercising TransactionListener offline.
+    """
+
+    def __init__(self, documents=None):
+        self.documents = dict(documents or {})
+        self._callbacks = []
+        self._handles = []
+
+    def on_snapshot(self, callback):
+        self._callbacks.append(callback)
+        initial = [self._change("ADDED", doc_id, data) for doc_id, data in self.documents.items()]
+        callback(None, initial, time.time())
+        handle = SimpleNamespace(is_active=True)
+        handle.unsubscribe = lambda: self._unsubscribe(callback, handle)
+        self._handles.append(handle)
+        return handle
+
+    def disconnect(self):
+        """Drop every subscriber without notice, like a watch stream that failed"""
+        self._callbacks.clear()
+        for handle in self._handles:
+            handle.is_active = False
+
+    def _unsubscribe(self, callback, handle):
+        handle.is_active = False
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def add(self, doc_id, data):
+        self.documents[doc_id] = data
+        self._emit("ADDED", doc_id, data)
+
+    def modify(self, doc_id, data):
+        self.documents[doc_id] = data
+        self._emit("MODIFIED", doc_id, data)
+
+    def remove(self, doc_id):
+        data = self.documents.pop(doc_id)
+        self._emit("REMOVED", doc_id, data)
+
+    def _emit(self, kind, doc_id, data):
+        for callback in list(self._callbacks):
+            callback(None, [self._change(kind, doc_id, data)], time.time())
+
+    @staticmethod
+    def _change(kind, doc_id, data):
+        document = SimpleNamespace(id=doc_id, to_dict=lambda: dict(data))
+        return SimpleNamespace(type=SimpleNamespace(name=kind), document=document)
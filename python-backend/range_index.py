@@ -0,0 +1,156 @@
+import numpy as np
+
+GROW_MARGIN = 64  # spare days added on each side when a tree has to be widened
+
+
+class FenwickTree:
+    """Binary indexed tree of (amount, count) over consecutive day ordinals.
+
+    Covers days [base, base + size); adding a day outside that span rebuilds
+    the tree over a wider span in O(size).
+    """
+
+    def __init__(self, base, size):
+        self.base = base
+        self.size = size
+        self.amount = np.zeros(size + 1, dtype=np.int64)
+        self.count = np.zeros(size + 1, dtype=np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.amount.nbytes + self.count.nbytes
+
+    def add(self, day, amount, count=1):
+        if not self.base <= day < self.base + self.size:
+            self._widen(day)
+        i = day - self.base + 1
+        while i <= self.size:
+            self.amount[i] += amount
+            self.count[i] += count
+            i += i & -i
+
+    def prefix(self, day):
+        """(amount, count) over days [base, day]"""
+        i = min(day - self.base + 1, self.size)
+        amount = count = 0
+        while i > 0:
+            amount += int(self.amount[i])
+            count += int(self.count[i])
+            i -= i & -i
+        return amount, count
+
+    def range(self, start, end):
+        """(amount, count) over inclusive days [start, end]"""
+        if end < start:
+            return 0, 0
+        hi = self.prefix(end)
+        lo = self.prefix(start - 1)
+        return hi[0] - lo[0], hi[1] - lo[1]
+
+    def copy(self):
+        clone = FenwickTree(self.base, self.size)
+        clone.amount = self.amount.copy()
+        clone.count = self.count.copy()
+        return clone
+
+    def _widen(self, day):
+        lo = min(self.base, day - GROW_MARGIN)
+        hi = max(self.base + self.size, day + GROW_MARGIN + 1)
+        amount, count = self._point_values()
+        wider = FenwickTree(lo, hi - lo)
+        offset = self.base - lo
+        wider.amount[offset + 1:offset + 1 + self.size] = amount
+        wider.count[offset + 1:offset + 1 + self.size] = count
+        wider._build()
+        self.base, self.size, self.amount, self.count = wider.base, wider.size, wider.amount, wider.count
+
+    def _point_values(self):
+        """Undo the tree layout back into per-day values in O(size)"""
+        amount, count = self.amount.copy(), self.count.copy()
+        for i in range(self.size, 0, -1):
+            j = i + (i & -i)
+            if j <= self.size:
+                amount[j] -= amount[i]
+                count[j] -= count[i]
+        return amount[1:], count[1:]
+
+    def _build(self):
+        """Turn per-day values (at index day - base + 1) into the tree layout in O(size)"""
+        for i in range(1, self.size + 1):
+            j = i + (i & -i)
+            if j <= self.size:
+                self.amount[j] += self.amount[i]
+                self.count[j] += self.count[i]
+
+    @classmethod
+    def from_points(cls, base, size, days, amounts, counts=None):
+        tree = cls(base, size)
+        if len(days):
+            index = np.asarray(days, dtype=np.int64) - base + 1
+            np.add.at(tree.amount, index, np.asarray(amounts, dtype=np.int64))
+            np.add.at(tree.count, index, 1 if counts is None else np.asarray(counts, dtype=np.int64))
+            tree._build()
+        return tree
+
+
+class RangeIndex:
+    """Per-user, per-(category, type) Fenwick trees for date-range totals.
+
+    A user's trees are built from the store's columns the first time that user
+    is queried and are kept current by add/remove afterwards, so memory is only
+    spent on users who actually ask range questions.
+    """
+
+    def __init__(self):
+        self.trees = {}  # user -> {(category, type): FenwickTree}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tree.nbytes for trees in self.trees.values() for tree in trees.values())
+
+    def add(self, user, category, type_, amount, day, count=1):
+        trees = self.trees.get(user)
+        if trees is None or not day:
+            return
+        tree = trees.get((category, type_))
+        if tree is None:
+            tree = trees[(category, type_)] = FenwickTree(day - GROW_MARGIN, 2 * GROW_MARGIN + 1)
+        tree.add(day, amount, count)
+
+    def remove(self, user, category, type_, amount, day):
+        self.add(user, category, type_, -amount, day, count=-1)
+
+    def ensure(self, store, user):
+        """Build the user's trees from the store's columns if they do not exist yet"""
+        if user in self.trees:
+            return self.trees[user]
+        day = store.column("day")
+        mask = (store.column("user") == user) & (day > 0)
+        trees = {}
+        if mask.any():
+            days = day[mask].astype(np.int64)
+            base, size = int(days.min()), int(days.max() - days.min()) + 1
+            amount = store.column("amount")[mask]
+            category = store.column("category")[mask]
+            type_ = store.column("type")[mask]
+            for key in set(zip(category.tolist(), type_.tolist())):
+                rows = (category == key[0]) & (type_ == key[1])
+                trees[key] = FenwickTree.from_points(base, size, days[rows], amount[rows])
+        self.trees[user] = trees
+        return trees
+
+    def totals(self, store, user, start, end) -> dict:
+        """(category, type) -> [total_cents, count] over inclusive day ordinals [start, end]"""
+        result = {}
+        for key, tree in self.ensure(store, user).items():
+            amount, count = tree.range(start, end)
+            if count:
+                result[key] = [amount, count]
+        return result
+
+    def copy(self):
+        clone = RangeIndex()
+        # list() first: readers may be adding a lazily built user while we copy
+        clone.trees = {user: {key: tree.copy() for key, tree in trees.items()}
+                       for user, trees in list(self.trees.items())}
+        return clone
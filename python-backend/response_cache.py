@@ -0,0 +1,91 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+from cache import LRUCache
+
+_PUNCTUATION = re.compile(r"[^\w\s$%.]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Case, punctuation and spacing differences should not miss the cache"""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _SPACES.sub(" ", text).strip(" .")
+
+
+class ResponseCache:
+    """Model answers keyed by (user, normalized query, data fingerprint, conversation context).
+
+    The fingerprint is derived from the transactions' content (not a counter),
+    so it changes whenever that user's transactions change and means the same
+    thing in every process and after a restart; a stale answer is never served
+    from the shared SQLite tier after new data lands. Entries live in an
+    LRU memory tier bounded by count, bytes and TTL, optionally backed by a
+    SQLite file so answers survive restarts.
+    """
+
+    def __init__(self, max_entries=2000, max_bytes=16 * 1024 * 1024, ttl=3600, path=None, disk_max_entries=50000):
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, stored_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+            self._db.commit()
+
+    @staticmethod
+    def key(user_id, query, fingerprint, context="") -> str:
+        """`context` is anything else the answer depends on, e.g. the conversation so far"""
+        raw = f"{user_id}\x00{fingerprint}\x00{normalize_query(query)}\x00{context}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        response = self.memory.get(key)
+        if response or self._db is None:
+            return response or None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        if row is None or not row[0]:
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, row[0])
+        return row[0]
+
+    def set(self, key, response):
+        if not response:
+            return  # an empty answer is a failed call, never something to serve again
+        self.memory.set(key, response)
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, time.time()))
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._prune()
+            self._db.commit()
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["disk_enabled"] = self._db is not None
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+    def _prune(self):
+        """Drop expired rows and keep the newest disk_max_entries"""
+        self._db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)",
+            (self.disk_max_entries,),
+        )
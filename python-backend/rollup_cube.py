@@ -0,0 +1,150 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+DAY, WEEK, MONTH = "day", "week", "month"
+PERIODS = ("week", "month", "quarter", "year")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Approximate CPython cost of one (category, type) -> [total, count] cell and of
+# one bucket's dict, for cache accounting
+CELL_BYTES = 200
+BUCKET_BYTES = 220
+
+
+def week_key(day) -> int:
+    """Ordinal of the Monday starting the ISO week (ordinal 1 is a Monday)"""
+    return day - (day - 1) % 7
+
+
+def month_key(day) -> int:
+    d = date.fromordinal(day)
+    return d.year * 12 + d.month - 1
+
+
+def month_bounds(key):
+    """First and last day ordinals of a month key"""
+    year, month = divmod(key, 12)
+    first = date(year, month + 1, 1).toordinal()
+    nyear, nmonth = divmod(key + 1, 12)
+    return first, date(nyear, nmonth + 1, 1).toordinal() - 1
+
+
+def shift_months(d: date, months: int) -> date:
+    """Calendar month arithmetic, clamping to the last day of shorter months"""
+    year, month = divmod(d.year * 12 + d.month - 1 + months, 12)
+    last = (date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1) - timedelta(days=1)).day
+    return date(year, month + 1, min(d.day, last))
+
+
+def period_windows(period, today=None):
+    """(current, previous) inclusive day-ordinal ranges for the dashboard periods.
+
+    Like the dashboard, the current window runs from one period ago through
+    today; the previous window is the period before it (without sharing the
+    boundary day).
+    """
+    today = today or date.today()
+    if period == "week":
+        start = today - timedelta(days=7)
+        prev_start = today - timedelta(days=14)
+    else:
+        months = {"month": 1, "quarter": 3, "year": 12}[period]
+        start = shift_months(today, -months)
+        prev_start = shift_months(today, -2 * months)
+    return ((start.toordinal(), today.toordinal()),
+            (prev_start.toordinal(), start.toordinal() - 1))
+
+
+class RollupCube:
+    """Week and month buckets x (category, type), per user, for dashboard trends.
+
+    Each bucket maps (category, type) -> [total_cents, count]. Like RangeIndex,
+    a user's buckets are built from the store's columns the first time that
+    user asks for a trend and are kept current by add/remove afterwards, so
+    memory is only spent on users who open the dashboard. Day-level figures
+    and arbitrary windows come from RangeIndex's Fenwick trees instead.
+    """
+
+    def __init__(self):
+        self.users = {}  # user -> {granularity: {bucket: cells}}
+
+    @property
+    def nbytes(self) -> int:
+        """Rough size: dict slots plus one small list per cell"""
+        cells = sum(len(c) for buckets in self.users.values() for table in buckets.values() for c in table.values())
+        buckets = sum(len(table) for buckets in self.users.values() for table in buckets.values())
+        return cells * CELL_BYTES + buckets * BUCKET_BYTES
+
+    def add(self, user, category, type_, amount, day, count=1):
+        buckets = self.users.get(user)
+        if buckets is None or not day:
+            return
+        for granularity, bucket in ((WEEK, week_key(day)), (MONTH, month_key(day))):
+            _add(buckets[granularity], bucket, (category, type_), amount, count)
+
+    def remove(self, user, category, type_, amount, day):
+        self.add(user, category, type_, -amount, day, count=-1)
+
+    def ensure(self, store, user):
+        """Build the user's buckets from the store's columns if they do not exist yet"""
+        buckets = self.users.get(user)
+        if buckets is not None:
+            return buckets
+        buckets = {WEEK: {}, MONTH: {}}
+        day = store.column("day")
+        mask = (store.column("user") == user) & (day > 0)
+        if mask.any():
+            days = day[mask].astype(np.int64)
+            fields = [store.column(name)[mask].astype(np.int64) for name in ("category", "type")]
+            amount = store.column("amount")[mask]
+            for granularity, keys in ((WEEK, days - (days - 1) % 7), (MONTH, month_keys(days))):
+                grouped = np.stack([keys] + fields)
+                groups, inverse = np.unique(grouped, axis=1, return_inverse=True)
+                inverse = inverse.ravel()
+                totals = np.zeros(groups.shape[1], dtype=np.int64)
+                np.add.at(totals, inverse, amount)
+                counts = np.bincount(inverse, minlength=groups.shape[1])
+                for (bucket, category, type_), total, count in zip(groups.T.tolist(), totals.tolist(), counts.tolist()):
+                    _add(buckets[granularity], bucket, (category, type_), total, count)
+        self.users[user] = buckets
+        return buckets
+
+    def series(self, store, user, granularity, start, end) -> list:
+        """[(bucket start ordinal, cells)] for each week or month bucket overlapping [start, end]"""
+        table = self.ensure(store, user)[granularity]
+        if granularity == MONTH:
+            keys = range(month_key(start), month_key(end) + 1)
+            return [(month_bounds(k)[0], table.get(k, {})) for k in keys]
+        return [(b, table.get(b, {})) for b in range(week_key(start), end + 1, 7)]
+
+    def copy(self):
+        clone = RollupCube()
+        # list() first: readers may be adding a lazily built user while we copy
+        clone.users = {
+            user: {granularity: {bucket: {key: list(cell) for key, cell in cells.items()}
+                                 for bucket, cells in table.items()}
+                   for granularity, table in buckets.items()}
+            for user, buckets in list(self.users.items())
+        }
+        return clone
+
+
+def _add(table, bucket, key, amount, count):
+    cells = table.get(bucket)
+    if cells is None:
+        cells = table[bucket] = {}
+    cell = cells.get(key)
+    if cell is None:
+        cell = cells[key] = [0, 0]
+    cell[0] += amount
+    cell[1] += count
+    if not cell[1]:
+        del cells[key]
+        if not cells:
+            del table[bucket]
+
+
+def month_keys(days):
+    """Vectorized month_key over an array of day ordinals"""
+    months = (days - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return months + 1970 * 12
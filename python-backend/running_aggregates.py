@@ -0,0 +1,306 @@
+import heapq
+
+import numpy as np
+
+from range_index import RangeIndex
+from rollup_cube import DAY, RollupCube
+
+RECENT_LIMIT = 5
+# Approximate CPython cost of one cell (key tuple, [total, count, min, max]
+# list and dict slot) and of one user_rows entry, for cache accounting
+CELL_BYTES = 300
+USER_ROW_BYTES = 100
+
+
+class CellTable:
+    """Sum, count and date range per group key, where the key is a tuple of column codes.
+
+    Days are ordinals; 0 means unknown and is left out of date ranges. A removal
+    that takes away a cell's min/max day only marks the cell stale; settle()
+    repairs it from the store's columns before anything reads the ranges.
+
+    A table built from columns (or loaded from a snapshot file) starts out as
+    sorted arrays (see packed()) and is only unpacked into the `cells` dict
+    when something writes to it or reads it whole, so a published store that
+    is only queried per user never pays for the dict.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._cells = {}  # key -> [total_cents, count, min_day, max_day]
+        self._packed = None  # arrays the cells are read from until first unpacked
+        self._stale = set()
+
+    def __len__(self):
+        packed = self._packed
+        return len(packed["total"]) if packed is not None else len(self._cells)
+
+    @property
+    def cells(self) -> dict:
+        packed = self._packed
+        if packed is not None:
+            self._cells = unpack_cells(packed)  # set before dropping the arrays, for concurrent readers
+            self._packed = None
+        return self._cells
+
+    @property
+    def nbytes(self) -> int:
+        packed = self._packed
+        if packed is not None:
+            return sum(array.nbytes for array in packed.values())
+        return len(self._cells) * CELL_BYTES
+
+    def add(self, key, amount, day):
+        cells = self.cells
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0, 0, None, None]
+        cell[0] += amount
+        cell[1] += 1
+        if day:
+            cell[2] = day if cell[2] is None else min(cell[2], day)
+            cell[3] = day if cell[3] is None else max(cell[3], day)
+
+    def remove(self, key, amount, day):
+        cells = self.cells
+        cell = cells[key]
+        cell[0] -= amount
+        cell[1] -= 1
+        if cell[1] == 0:
+            del cells[key]
+            self._stale.discard(key)
+        elif day and day in (cell[2], cell[3]):
+            self._stale.add(key)
+
+    def group(self, code) -> dict:
+        """{rest of key: cell} for the keys whose first field is `code`, without unpacking the table"""
+        packed = self._packed
+        if packed is None:
+            return {key[1:]: cell for key, cell in self._cells.items() if key[0] == code}
+        lo, hi = np.searchsorted(packed["keys"][:, 0], [code, code + 1])
+        return unpack_cells({name: array[lo:hi] for name, array in packed.items()}, start=1)
+
+    def settle(self, store):
+        if not self._stale:
+            return
+        columns = [store.column(name) for name in self.fields]
+        day = store.column("day")
+        for key in self._stale:
+            mask = day > 0
+            for column, code in zip(columns, key):
+                mask &= column == code
+            days = day[mask]
+            cell = self._cells[key]
+            cell[2], cell[3] = (int(days.min()), int(days.max())) if len(days) else (None, None)
+        self._stale.clear()
+
+    def packed(self) -> dict:
+        """The table as arrays sorted by key: `keys` (one int32 column per field),
+        int64 `total` and `count`, and int32 `first` / `last` days (0 = none).
+        Call after settle().
+        """
+        packed = self._packed
+        if packed is not None:
+            return packed
+        keys = np.array(list(self._cells), dtype=np.int32).reshape(len(self._cells), len(self.fields))
+        figures = np.array([[c[0], c[1], c[2] or 0, c[3] or 0] for c in self._cells.values()],
+                           dtype=np.int64).reshape(len(self._cells), 4)
+        order = np.lexsort(keys.T[::-1]) if len(keys) else np.zeros(0, dtype=np.int64)
+        return {
+            "keys": keys[order],
+            "total": figures[order, 0],
+            "count": figures[order, 1],
+            "first": figures[order, 2].astype(np.int32),
+            "last": figures[order, 3].astype(np.int32),
+        }
+
+    def copy(self):
+        clone = CellTable(self.fields)
+        if self._packed is not None:
+            clone._packed = self._packed  # read-only; the clone unpacks its own dict on first write
+        else:
+            clone._cells = {key: list(cell) for key, cell in self._cells.items()}
+        clone._stale = set(self._stale)
+        return clone
+
+    @classmethod
+    def from_packed(cls, fields, packed):
+        """A table over arrays from packed(), e.g. memory-mapped from a snapshot file"""
+        table = cls(fields)
+        table._packed = packed
+        return table
+
+    @classmethod
+    def from_columns(cls, fields, columns):
+        """Build every cell with a few grouped reductions instead of row-by-row adds"""
+        codes = [np.asarray(columns[name], dtype=np.int64) for name in fields]
+        if not len(codes[0]):
+            return cls(fields)
+        strides = [int(c.max()) + 1 for c in codes]
+        packed = np.zeros(len(codes[0]), dtype=np.int64)
+        for c, stride in zip(codes, strides):
+            packed = packed * stride + c
+        keys, inverse = np.unique(packed, return_inverse=True)  # sorted, so the keys come out in order
+
+        amount = np.asarray(columns["amount"], dtype=np.int64)
+        day = np.asarray(columns["day"], dtype=np.int64)
+        totals = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(totals, inverse, amount)
+        counts = np.bincount(inverse, minlength=len(keys)).astype(np.int64)
+        known = day > 0
+        lo = np.full(len(keys), np.iinfo(np.int64).max)
+        hi = np.zeros(len(keys), dtype=np.int64)
+        np.minimum.at(lo, inverse[known], day[known])
+        np.maximum.at(hi, inverse[known], day[known])
+
+        parts = []
+        for stride in reversed(strides):
+            keys, code = np.divmod(keys, stride)
+            parts.append(code)
+        return cls.from_packed(fields, {
+            "keys": np.stack(parts[::-1], axis=1).astype(np.int32),
+            "total": totals,
+            "count": counts,
+            "first": np.where(hi > 0, lo, 0).astype(np.int32),
+            "last": hi.astype(np.int32),
+        })
+
+
+def unpack_cells(packed, start=0) -> dict:
+    """{key[start:]: [total, count, min_day, max_day]} from packed arrays"""
+    keys = map(tuple, packed["keys"][:, start:].tolist())
+    figures = zip(packed["total"].tolist(), packed["count"].tolist(),
+                  packed["first"].tolist(), packed["last"].tolist())
+    return {key: [total, count, first or None, last or None] for key, (total, count, first, last) in zip(keys, figures)}
+
+
+class RunningAggregates:
+    """Running totals for a TransactionStore, updated on every row change.
+
+    `by_user` holds (user, category, type) cells for per-user questions;
+    `by_category` holds the same figures rolled up over users, so a snapshot
+    costs O(categories x types). `ranges` answers arbitrary date ranges in
+    O(log days) and `cube` buckets the figures by week and month for trends;
+    both are built per user on first use. `latest` keeps the newest rows for
+    the "recent transactions" list.
+    """
+
+    def __init__(self, recent_limit=RECENT_LIMIT):
+        self.by_user = CellTable(("user", "category", "type"))
+        self.by_category = CellTable(("category", "type"))
+        self.user_rows = {}  # user code -> row count
+        self.cube = RollupCube()
+        self.ranges = RangeIndex()
+        self.recent_limit = recent_limit
+        self.latest = []  # min-heap of (day, doc_id)
+        self._stale_latest = False
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory held by every table, including the lazily built per-user indexes"""
+        return (self.by_user.nbytes + self.by_category.nbytes + len(self.user_rows) * USER_ROW_BYTES
+                + self.cube.nbytes + self.ranges.nbytes)
+
+    def built_users(self):
+        """How many users have lazily built indexes (their size only changes with these or the rows)"""
+        return len(self.cube.users), len(self.ranges.trees)
+
+    def add(self, doc_id, user, category, type_, amount, day):
+        self.by_user.add((user, category, type_), amount, day)
+        self.by_category.add((category, type_), amount, day)
+        self.user_rows[user] = self.user_rows.get(user, 0) + 1
+        self.cube.add(user, category, type_, amount, day)
+        self.ranges.add(user, category, type_, amount, day)
+        if len(self.latest) < self.recent_limit:
+            heapq.heappush(self.latest, (day, doc_id))
+        elif (day, doc_id) > self.latest[0]:
+            heapq.heapreplace(self.latest, (day, doc_id))
+
+    def remove(self, doc_id, user, category, type_, amount, day):
+        self.by_user.remove((user, category, type_), amount, day)
+        self.by_category.remove((category, type_), amount, day)
+        self.user_rows[user] -= 1
+        if not self.user_rows[user]:
+            del self.user_rows[user]
+        self.cube.remove(user, category, type_, amount, day)
+        self.ranges.remove(user, category, type_, amount, day)
+        if (day, doc_id) in self.latest:
+            self.latest.remove((day, doc_id))
+            heapq.heapify(self.latest)
+            self._stale_latest = True
+
+    def series(self, store, user, granularity, start, end) -> list:
+        """[(bucket start ordinal, cells)] per day, week or month bucket overlapping [start, end]"""
+        if granularity == DAY:
+            return [(d, self.ranges.totals(store, user, d, d)) for d in range(start, end + 1)]
+        return self.cube.series(store, user, granularity, start, end)
+
+    def settle(self, store):
+        """Recompute date ranges and latest rows invalidated by removals"""
+        self.by_user.settle(store)
+        self.by_category.settle(store)
+        if self._stale_latest:
+            self.latest = latest_rows(store.ids, store.column("day"), self.recent_limit)
+            self._stale_latest = False
+
+    def copy(self):
+        clone = RunningAggregates(self.recent_limit)
+        clone.by_user = self.by_user.copy()
+        clone.by_category = self.by_category.copy()
+        clone.user_rows = dict(self.user_rows)
+        clone.cube = self.cube.copy()
+        clone.ranges = self.ranges.copy()
+        clone.latest = list(self.latest)
+        clone._stale_latest = self._stale_latest
+        return clone
+
+    def packed(self) -> dict:
+        """by_user, by_category and user_rows as flat named arrays (call after settle()).
+
+        The per-user indexes and the latest rows are not included: the first
+        are built on demand and the second is cheap to recompute.
+        """
+        arrays = {}
+        for name in ("by_user", "by_category"):
+            for field, array in getattr(self, name).packed().items():
+                arrays[f"{name}.{field}"] = array
+        arrays["user_rows.user"] = np.array(list(self.user_rows), dtype=np.int32)
+        arrays["user_rows.count"] = np.array(list(self.user_rows.values()), dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def from_packed(cls, ids, day, arrays, recent_limit=RECENT_LIMIT):
+        """Aggregates over arrays from packed(); only user_rows and the latest rows are rebuilt"""
+        agg = cls(recent_limit)
+        for name in ("by_user", "by_category"):
+            fields = getattr(agg, name).fields
+            prefix = f"{name}."
+            setattr(agg, name, CellTable.from_packed(fields, {
+                key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)
+            }))
+        agg.user_rows = dict(zip(arrays["user_rows.user"].tolist(), arrays["user_rows.count"].tolist()))
+        agg.latest = latest_rows(ids, day, recent_limit)
+        return agg
+
+    @classmethod
+    def from_columns(cls, ids, columns, recent_limit=RECENT_LIMIT):
+        agg = cls(recent_limit)
+        agg.by_user = CellTable.from_columns(agg.by_user.fields, columns)
+        agg.by_category = CellTable.from_columns(agg.by_category.fields, columns)
+        if len(ids):
+            users, counts = np.unique(columns["user"], return_counts=True)
+            agg.user_rows = dict(zip(users.tolist(), counts.tolist()))
+        agg.latest = latest_rows(ids, columns["day"], recent_limit)
+        return agg
+
+
+def latest_rows(ids, day, limit):
+    """(day, doc_id) heap of the `limit` newest rows"""
+    n = len(day)
+    k = min(limit, n)
+    if not k:
+        return []
+    rows = np.argpartition(day, n - k)[n - k:]
+    latest = [(int(day[i]), ids[i]) for i in rows]
+    heapq.heapify(latest)
+    return latest
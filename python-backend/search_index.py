@@ -0,0 +1,132 @@
+import heapq
+import math
+import re
+
+K1, B = 1.2, 0.75  # standard BM25 parameters
+# Approximate CPython cost of one term's postings dict, one (doc, frequency)
+# posting and one indexed document, for cache accounting
+TERM_BYTES, POSTING_BYTES, DOC_BYTES = 150, 30, 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "by", "did", "do", "for", "from", "how", "i", "in", "is",
+    "it", "me", "much", "my", "of", "on", "or", "show", "the", "to", "was", "what", "when",
+    "where", "which", "with", "you", "your",
+}
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def terms(text) -> list:
+    """Lowercased word terms without stopwords, with a plural 's' stripped"""
+    words = _WORDS.findall(str(text or "").lower())
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+            for w in words if w not in STOPWORDS]
+
+
+class UserIndex:
+    """Inverted index over one user's transactions (description + category)"""
+
+    def __init__(self):
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.lengths = {}  # doc_id -> number of terms
+        self.total_length = 0
+        self.entries = 0  # (term, doc) postings
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.postings) * TERM_BYTES + self.entries * POSTING_BYTES + len(self.lengths) * DOC_BYTES
+
+    def add(self, doc_id, words):
+        self.lengths[doc_id] = len(words)
+        self.total_length += len(words)
+        for word in words:
+            docs = self.postings.get(word)
+            if docs is None:
+                docs = self.postings[word] = {}
+            if doc_id not in docs:
+                self.entries += 1
+            docs[doc_id] = docs.get(doc_id, 0) + 1
+
+    def remove(self, doc_id, words):
+        self.total_length -= self.lengths.pop(doc_id, 0)
+        for word in set(words):
+            docs = self.postings.get(word)
+            if docs is not None and docs.pop(doc_id, None) is not None:
+                self.entries -= 1
+                if not docs:
+                    del self.postings[word]
+
+    def search(self, query_terms, k) -> list:
+        """[(score, doc_id)] of the k best BM25 matches"""
+        n = len(self.lengths)
+        if not n:
+            return []
+        avg = self.total_length / n or 1
+        scores = {}
+        for word in set(query_terms):
+            docs = self.postings.get(word)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + K1 * (1 - B + B * self.lengths[doc_id] / avg)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / norm
+        return heapq.nlargest(k, ((score, doc_id) for doc_id, score in scores.items()))
+
+    def copy(self):
+        clone = UserIndex()
+        clone.postings = {word: dict(docs) for word, docs in self.postings.items()}
+        clone.lengths = dict(self.lengths)
+        clone.total_length = self.total_length
+        clone.entries = self.entries
+        return clone
+
+
+class SearchIndex:
+    """Per-user BM25 keyword index over transaction descriptions and categories.
+
+    Like RangeIndex, a user's index is built from the store the first time that
+    user searches and is kept current by add/remove afterwards. Everything is
+    local: no embeddings service or network call is involved.
+    """
+
+    def __init__(self):
+        self.users = {}  # user code -> UserIndex
+
+    @property
+    def nbytes(self) -> int:
+        return sum(index.nbytes for index in list(self.users.values()))
+
+    def add(self, user, doc_id, description, category):
+        index = self.users.get(user)
+        if index is not None:
+            index.add(doc_id, terms(description) + terms(category))
+
+    def remove(self, user, doc_id, description, category):
+        index = self.users.get(user)
+        if index is not None:
+            index.remove(doc_id, terms(description) + terms(category))
+
+    def ensure(self, store, user):
+        """Build the user's index from the store if it does not exist yet"""
+        index = self.users.get(user)
+        if index is None:
+            # Build privately, then publish with one assignment (readers may share this store)
+            index = UserIndex()
+            names = store.categories.values
+            category = store.column("category")
+            for row in map(int, (store.column("user") == user).nonzero()[0]):
+                index.add(store.ids[row], terms(store.descriptions[row]) + terms(names[category[row]]))
+            self.users[user] = index
+        return index
+
+    def search(self, store, user, query, k=5) -> list:
+        """Doc ids of the user's k transactions most relevant to the query, best first"""
+        words = terms(query)
+        if not words:
+            return []
+        return [doc_id for _, doc_id in self.ensure(store, user).search(words, k)]
+
+    def copy(self):
+        clone = SearchIndex()
+        clone.users = {user: index.copy() for user, index in list(self.users.items())}
+        return clone
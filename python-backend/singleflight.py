@@ -0,0 +1,74 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    def do(self, key, fn, *args, **kwargs):
+        """Call fn, or wait for the identical call already running, and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do_async(self, key, fn, *args, **kwargs) -> bool:
+        """Start fn on a background thread unless that key is already in flight"""
+        if self.in_flight(key):
+            return False
+
+        def run():
+            try:
+                self.do(key, fn, *args, **kwargs)
+            except Exception as e:
+                print(f"⚠️ Background refresh failed: {str(e)}")
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "shared": self.shared,
+        }
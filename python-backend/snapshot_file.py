@@ -0,0 +1,183 @@
+import json
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl  # POSIX only; without it every process refreshes for itself
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+from transaction_store import COLUMNS, Snapshot, TransactionStore
+
+# File layout: MAGIC, uint32 header length, JSON header, then (64-byte aligned)
+# the raw column arrays, the packed aggregate tables (RunningAggregates.packed()),
+# the sorted document id index (TransactionStore.id_index()) and a JSON blob of
+# document ids and descriptions. Array offsets in the header
+# are relative to the aligned data start, so each array can be memory-mapped in
+# place with np.memmap. Every save bumps the header's generation, which is how
+# other processes notice a new snapshot.
+MAGIC = b"FTSNAP01"
+ALIGN = 64
+
+
+def _aligned(n) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _time(value):
+    """high_water as JSON; anything but a datetime is dropped (forcing a full load later)"""
+    return value.isoformat() if isinstance(value, datetime) else None
+
+
+def generation(path) -> int:
+    """Generation of the snapshot at `path` (0 if there is none)"""
+    try:
+        return read_header(path)[0].get("generation", 0)
+    except Exception:
+        return 0
+
+
+@contextmanager
+def locked(path):
+    """Exclusive cross-process lock for refreshing the snapshot at `path`"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save(path, snapshot):
+    """Write a snapshot's store to `path` atomically (readers never see a partial file)"""
+    store = snapshot.store
+    columns, sections, offset = {}, {"aggregates": {}, "id_index": {}}, 0
+    arrays = []
+    for name in COLUMNS:
+        array = np.ascontiguousarray(store.column(name))
+        columns[name] = [array.dtype.str, offset]
+        arrays.append((offset, array))
+        offset = _aligned(offset + array.nbytes)
+    ids, rows = store.id_index()
+    packed = {"aggregates": store.aggregates.packed(), "id_index": {"ids": ids, "rows": rows}}
+    for section, named in packed.items():
+        for name, array in named.items():
+            array = np.ascontiguousarray(array)
+            sections[section][name] = [array.dtype.str, offset, list(array.shape)]
+            arrays.append((offset, array))
+            offset = _aligned(offset + array.nbytes)
+    strings = json.dumps({"ids": store.ids, "descriptions": store.descriptions}).encode("utf-8")
+    header = json.dumps({
+        "generation": generation(path) + 1,
+        "size": store.size,
+        "fingerprint": store.fingerprint,
+        "high_water": _time(store.high_water),
+        "last_full_sync": store.last_full_sync,
+        "last_checked": store.last_checked,
+        "refreshed_at": snapshot.refreshed_at,
+        "categories": store.categories.values,
+        "types": store.types.values,
+        "users": store.users.values,
+        "columns": columns,
+        **sections,
+        "strings": [offset, len(strings)],
+    }, default=str).encode("utf-8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            start = _aligned(f.tell())
+            for array_offset, array in arrays:
+                f.seek(start + array_offset)
+                f.write(array.tobytes())
+            f.seek(start + offset)
+            f.write(strings)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_header(path):
+    """(header dict, data start offset) of a snapshot file"""
+    with open(path, "rb") as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a transaction snapshot")
+        (length,) = struct.unpack("<I", prefix[len(MAGIC):])
+        header = json.loads(f.read(length))
+    return header, _aligned(len(MAGIC) + 4 + length)
+
+
+def _map(path, dtype, offset, shape):
+    """Read-only memory map of one array (no copy until a page is touched)"""
+    shape = tuple(shape)
+    if not np.prod(shape):
+        return np.zeros(shape, dtype=np.dtype(dtype))  # mmap cannot map zero bytes
+    return np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=shape)
+
+
+def map_columns(path, header, start) -> dict:
+    return {name: _map(path, dtype, start + offset, (header["size"],))
+            for name, (dtype, offset) in header["columns"].items()}
+
+
+def map_section(path, header, start, section):
+    """Named arrays of a header section ("aggregates", "id_index"), or None for a file written without it"""
+    if section not in header:
+        return None
+    return {name: _map(path, dtype, start + offset, shape)
+            for name, (dtype, offset, shape) in header[section].items()}
+
+
+def read_strings(path, header, start) -> dict:
+    offset, length = header["strings"]
+    with open(path, "rb") as f:
+        f.seek(start + offset)
+        return json.loads(f.read(length))
+
+
+def load(path):
+    """(Snapshot, generation) saved at `path`, or (None, 0) if there is no usable file.
+
+    The columns and the by_user / by_category aggregate tables stay
+    memory-mapped read-only, so processes that load the same file share those
+    pages. Everything else is still per process: document ids and
+    descriptions are parsed into lists (linear in the row count), user_rows
+    and the latest rows are rebuilt, and the search index and per-user
+    range/rollup indexes are built on first use. The doc id index and a
+    private dict per table are only built if the store is written to (copy()
+    for a delta merge).
+    """
+    try:
+        header, start = read_header(path)
+        columns = map_columns(path, header, start)
+        aggregates = map_section(path, header, start, "aggregates")
+        id_index = map_section(path, header, start, "id_index")
+        strings = read_strings(path, header, start)
+    except FileNotFoundError:
+        return None, 0
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable transaction snapshot {path}: {str(e)}")
+        return None, 0
+    store = TransactionStore.from_columns(
+        strings["ids"], columns, header["categories"], header["types"], header["users"], strings["descriptions"],
+        copy=False, fingerprint=header.get("fingerprint"), aggregates=aggregates,
+        id_index=(id_index["ids"], id_index["rows"]) if id_index else None,
+    )
+    store.high_water = datetime.fromisoformat(header["high_water"]) if header["high_water"] else None
+    store.last_full_sync = header["last_full_sync"]
+    store.last_checked = header.get("last_checked", store.last_full_sync)
+    return Snapshot.publish(store, header["refreshed_at"]), header.get("generation", 0)
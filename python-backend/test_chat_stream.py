@@ -0,0 +1,120 @@
+"""/chat/stream against a local fake of Gemini's streamGenerateContent endpoint"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeGemini(BaseHTTPRequestHandler):
+    """Streams each of `chunks` as an SSE frame (None: a frame with only a finishReason);
+    with `break_after` set, drops the connection after that many"""
+
+    protocol_version = "HTTP/1.1"
+    chunks = ["Hello", " there"]
+    break_after = None
+    calls = 0
+    requests = []  # (path, x-goog-api-key header) per call
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FakeGemini.calls += 1
+        FakeGemini.requests.append((self.path, self.headers.get("x-goog-api-key")))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, text in enumerate(self.chunks):
+            if i == self.break_after:
+                self.close_connection = True  # no terminating chunk: the client sees a broken stream
+                return
+            if text is None:
+                event = {"candidates": [{"finishReason": "SAFETY"}]}
+            else:
+                event = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+            frame = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["GEMINI_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1/models/fake:generateContent"
+    os.environ.pop("GEMINI_STREAM_URL", None)
+    os.environ["GEMINI_API_KEY"] = "test-key"
+    import app
+    yield app
+    server.shutdown()
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(FakeGemini, "chunks", ["Hello", " there", ", friend", " Café ₹500 ✓"])
+    monkeypatch.setattr(FakeGemini, "break_after", None)
+    return FakeGemini
+
+
+def events(response):
+    """(event, data) pairs of an SSE body; `event` is None for plain data frames"""
+    parsed = []
+    for frame in response.get_data(as_text=True).split("\n\n"):
+        if not frame.strip():
+            continue
+        fields = dict(line.split(": ", 1) for line in frame.splitlines())
+        parsed.append((fields.get("event"), json.loads(fields["data"])))
+    return parsed
+
+
+def ask(app_module, message):
+    client = app_module.app.test_client()
+    return client.post("/chat/stream", json={"message": message, "userId": "user1"})
+
+
+def test_stream_relays_chunks_then_done(app_module, fake):
+    response = ask(app_module, "Tell me a story about my savings")
+    assert response.status_code == 200
+    received = events(response)
+    assert [data["text"] for event, data in received if event is None] == ["Hello", " there", ", friend", " Café ₹500 ✓"]
+    assert received[-1][0] == "done"
+    assert received[-1][1]["status"] == "success"
+
+
+def test_failure_after_first_chunk_is_an_error_event(app_module, fake):
+    fake.break_after = 1
+    response = ask(app_module, "Tell me a story about my spending")
+    assert response.status_code == 200
+    received = events(response)
+    assert received[0] == (None, {"text": "Hello"})
+    assert received[-1][0] == "error"
+    assert "done" not in [event for event, _ in received]
+    assert not any("Error" in data.get("text", "") for _, data in received)
+
+
+def test_failure_before_first_chunk_is_a_500(app_module, fake):
+    fake.break_after = 0
+    response = ask(app_module, "Tell me a story about my income")
+    assert response.status_code == 500
+    assert response.get_json()["error"] == "Failed to process request"
+
+
+def test_empty_answer_is_an_error_and_not_cached(app_module, fake):
+    fake.chunks = [None]
+    calls = fake.calls
+    for _ in range(2):
+        response = ask(app_module, "Tell me a story about my rent")
+        assert response.status_code == 500
+    assert fake.calls == calls + 2  # the second ask went to the model again
+
+
+def test_api_key_is_sent_as_a_header_not_in_the_url(app_module, fake):
+    ask(app_module, "Tell me a story about my groceries")
+    path, key = fake.requests[-1]
+    assert key == "test-key"
+    assert "key=" not in path
@@ -0,0 +1,84 @@
+"""Which questions route() answers from the aggregates, with what figures, and which go to the model"""
+from datetime import date
+
+import pytest
+
+from intent_router import route
+from transaction_store import TransactionStore
+
+TODAY = date(2025, 4, 2)
+ROWS = [
+    {"amount": 5000, "category": "Salary", "type": "Income", "userId": "u", "date": "2025-03-30"},
+    {"amount": 120, "category": "Food", "type": "Expense", "userId": "u", "date": "2025-03-29"},
+    {"amount": 80.5, "category": "Food", "type": "Expense", "userId": "u", "date": "2025-02-10"},
+    {"amount": 200, "category": "Utilities", "type": "Expense", "userId": "u", "date": "2025-03-28"},
+    {"amount": 40, "category": "Transport", "type": "Expense", "userId": "u", "date": "2025-03-03"},
+    {"amount": 15, "category": "Fast Food", "type": "Expense", "userId": "u", "date": "2025-03-03"},
+    # Another user's rows must never show up in "u"'s figures
+    {"amount": 999, "category": "Food", "type": "Expense", "userId": "other", "date": "2025-03-28"},
+    {"amount": 1200, "category": "Rent", "type": "Expense", "userId": "other", "date": "2025-03-01"},
+]
+
+
+@pytest.fixture(scope="module")
+def store():
+    return TransactionStore.from_transactions(ROWS)
+
+
+ANSWERED = [
+    ("How much did I spend on food?", "category_spend", "You've spent $200.50 on Food."),
+    ("How much did I spend on fast food?", "category_spend", "You've spent $15.00 on Fast Food."),
+    ("How much did I spend on rent?", "category_spend", "You've spent $0.00 on Rent."),
+    ("How much did I spend on food in March?", "category_spend", "You've spent $120.00 on Food in March 2025."),
+    ("how much did I spend on food last month", "category_spend", "You've spent $120.00 on Food last month."),
+    ("How much did I spend between 2025-03-01 and 2025-03-29?", "total_spend",
+     "You've spent $375.00 in total between 2025-03-01 and 2025-03-29."),
+    ("How much have I spent in the last 7 days?", "total_spend", "You've spent $320.00 in total in the last 7 days."),
+    ("What's my total spending this month?", "total_spend", "You've spent $0.00 in total this month."),
+    ("How much did I earn in March 2025?", "total_income", "Your income in March 2025 is $5,000.00."),
+    ("What is my income?", "total_income", "Your income is $5,000.00."),
+    ("What's my balance?", "balance", "Your net balance is $4,544.50 ($5,000.00 income, $455.50 expenses)."),
+    ("Can I afford a $500 laptop?", "afford",
+     "Yes, you can afford a $500.00 purchase. You have approximately $4,544.50 available."),
+    ("can i afford a $2,000 purchase", "afford",
+     "A $2,000.00 purchase might be tight right now. You have approximately $4,544.50 available."),
+    ("What's my biggest spending category?", "top_category",
+     "Your biggest spending category is Food at $200.50, 44.0% of your $455.50 in expenses."),
+    ("Where did I spend the most in February?", "top_category",
+     "Your biggest spending category in February 2025 is Food at $80.50, 100.0% of your $80.50 in expenses."),
+]
+
+TO_MODEL = [
+    "what's my net worth",
+    "did I spend anything on rent",
+    "How much did I spend on March 3?",
+    "how much did I spend on 3/3",
+    "how much did I spend last friday",
+    "How much did I spend on food in Q1?",
+    "How many transactions did I make this month?",
+    "How much did I make?",
+    "How much does a Tesla cost?",
+    "what is my average spending per day",
+    "what percentage of my income did I spend",
+    "How much did I spend on food vs transport?",
+    "How much did I spend on food and transport?",
+    "did I spend more on food than last month",
+    "How can I spend less on food?",
+    "Can I afford a laptop?",
+    "can I afford a $500 laptop next month",
+    "tell me a joke",
+]
+
+
+@pytest.mark.parametrize("question, intent, answer", ANSWERED)
+def test_answered_locally(store, question, intent, answer):
+    assert route(store, "u", question, TODAY) == (intent, answer)
+
+
+@pytest.mark.parametrize("question", TO_MODEL)
+def test_falls_through_to_the_model(store, question):
+    assert route(store, "u", question, TODAY) is None
+
+
+def test_unknown_user_falls_through(store):
+    assert route(store, "nobody", "What's my balance?", TODAY) is None
@@ -0,0 +1,70 @@
+"""TransactionListener driven by a LocalChangeFeed"""
+import time
+
+import pytest
+
+from live_listener import LocalChangeFeed, TransactionListener
+
+
+def doc(user, amount, category="Food"):
+    return {"amount": amount, "category": category, "type": "expense", "userId": user, "date": "2025-03-01"}
+
+
+def ids(listener, user):
+    return set(listener.snapshot(user, timeout=1).store.ids)
+
+
+@pytest.fixture
+def feed():
+    return LocalChangeFeed({"a1": doc("alice", 10), "b1": doc("bob", 20)})
+
+
+@pytest.fixture
+def listener(feed):
+    listener = TransactionListener(feed, key_for=lambda data: data.get("userId"), check_interval=0.02).start()
+    yield listener
+    listener.stop()
+
+
+def test_initial_listing_is_split_by_scope(listener):
+    assert listener.ready.is_set()
+    assert ids(listener, "alice") == {"a1"}
+    assert ids(listener, "bob") == {"b1"}
+
+
+def test_modify_moves_a_document_between_scopes(feed, listener):
+    feed.add("a2", doc("alice", 5))
+    assert ids(listener, "alice") == {"a1", "a2"}
+
+    before = listener.snapshot("alice", timeout=1)
+    feed.modify("a2", doc("bob", 7, "Travel"))
+    assert ids(listener, "alice") == {"a1"}
+    assert ids(listener, "bob") == {"b1", "a2"}
+    bob = listener.snapshot("bob", timeout=1).store
+    assert bob.row(bob.row_of("a2"))["category"] == "Travel"
+    assert "a2" in before.store.ids  # published snapshots are never changed in place
+
+
+def test_remove(feed, listener):
+    feed.remove("b1")
+    assert ids(listener, "bob") == set()
+    assert ids(listener, "alice") == {"a1"}
+    assert listener.stats()["documents"] == 1
+
+
+def test_disconnect_resubscribes_and_replaces_every_store(feed, listener):
+    feed.disconnect()
+    assert not listener.active
+    # Changes made while nobody is subscribed are never delivered as events
+    feed.remove("a1")
+    feed.add("c1", doc("carol", 30))
+
+    deadline = time.monotonic() + 2
+    while (listener.restarts == 0 or not listener.active) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert listener.restarts == 1
+    assert listener.active
+    assert ids(listener, "alice") == set()  # the missed delete is gone after the full listing
+    assert ids(listener, "carol") == {"c1"}
+    assert ids(listener, "bob") == {"b1"}
+    assert listener.stats()["documents"] == 2
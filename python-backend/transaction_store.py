@@ -0,0 +1,393 @@
+import hashlib
+import itertools
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import numpy as np
+
+from running_aggregates import RunningAggregates
+from search_index import SearchIndex
+
+UNKNOWN_DAY = 0  # date ordinal used when a transaction has no parseable date
+COLUMNS = ("amount", "day", "category", "type", "user")
+
+# Process-wide, so a version number identifies one state of one store and is
+# never reused by a later (e.g. fully reloaded) store for the same scope
+_versions = itertools.count(1)
+FINGERPRINT_MOD = 1 << 64
+
+
+def to_cents(value) -> int:
+    """Amounts are stored as int64 minor units so sums stay exact"""
+    try:
+        return int(round(float(value) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+def from_cents(cents):
+    """Back to the int/float amounts the rest of the app (and the prompt) uses"""
+    cents = int(cents)
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+def day_ordinal(value) -> int:
+    """Proleptic Gregorian day number for a YYYY-MM-DD string, date or timestamp"""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10]).toordinal()
+        except ValueError:
+            return UNKNOWN_DAY
+    return UNKNOWN_DAY
+
+
+def row_digest(doc_id, cents, day, category, type_, user, description) -> int:
+    """Stable 64-bit hash of one row's content (the same in every process, unlike hash())"""
+    raw = repr((doc_id, int(cents), int(day), category, type_, user, description)).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "little")
+
+
+def ordinal_to_iso(day) -> str:
+    day = int(day)
+    return date.fromordinal(day).isoformat() if day > UNKNOWN_DAY else "unknown"
+
+
+class Vocabulary:
+    """Dictionary encoding for a low-cardinality string column"""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.encode(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value)
+
+
+class TransactionStore:
+    """Transactions for one cache scope, held column-wise and keyed by Firestore document id.
+
+    Each row costs a few dozen bytes: int64 amount (cents), int32 day ordinal and
+    int32 codes into per-store category / type / userId vocabularies, plus the
+    free-text description (a plain list, indexed lazily by `search`). Removal
+    swaps the last row into the freed slot, so row order is not meaningful.
+    Every row change is also applied to `aggregates`, so snapshot totals never
+    need a pass over the rows.
+
+    `version` is process-local and only invalidates in-memory derived caches.
+    `fingerprint` is the sum of every row's digest, kept current on each
+    write, so it identifies the content itself: two processes (or one process
+    before and after a restart) holding the same rows get the same
+    fingerprint, which makes it safe to key persistent caches on.
+    """
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._reset(capacity)
+        self.high_water = None  # newest createdAt merged so far
+        self.version = next(_versions)  # changes on every write so derived caches can invalidate
+        self.last_full_sync = None  # when the rows were last downloaded in full
+        self.last_checked = None  # when they were last known to match the server (a full sync or a totals check)
+        self._derived = {}
+        self._nbytes = None
+
+    def _reset(self, capacity):
+        self.amount = np.zeros(capacity, dtype=np.int64)
+        self.day = np.zeros(capacity, dtype=np.int32)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        self.type = np.zeros(capacity, dtype=np.int32)
+        self.user = np.zeros(capacity, dtype=np.int32)
+        self.categories = Vocabulary()
+        self.types = Vocabulary()
+        self.users = Vocabulary()
+        self.ids = []
+        self.descriptions = []
+        self._rows = {}  # doc id -> row; None until first needed (see _row_of)
+        self._id_index = None  # (sorted UTF-8 ids, their rows) from a snapshot file, used until _rows exists
+        self.size = 0
+        self.aggregates = RunningAggregates()
+        self.search = SearchIndex()
+        self.fingerprint = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory held: columns, ids, descriptions, aggregates and search index.
+
+        Recomputed only after the rows change or another user's lazy indexes
+        are built, so callers can re-check it on every request.
+        """
+        key = (self.version, self.aggregates.built_users(), len(self.search.users))
+        if self._nbytes is None or self._nbytes[0] != key:
+            arrays = sum(col.nbytes for col in self._columns())
+            ids = sys.getsizeof(self.ids) + sum(sys.getsizeof(i) for i in self.ids)
+            text = sys.getsizeof(self.descriptions) + sum(sys.getsizeof(d) for d in self.descriptions if d)
+            rows = arrays + ids + text + sys.getsizeof(self._rows or {})
+            self._nbytes = (key, rows + self.aggregates.nbytes + self.search.nbytes)
+        return self._nbytes[1]
+
+    @property
+    def _row_of(self) -> dict:
+        """doc id -> row, built on first use: a loaded store that is only read may never need it"""
+        rows = self._rows
+        if rows is None:
+            rows = self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        return rows
+
+    def _columns(self):
+        return tuple(getattr(self, name) for name in COLUMNS)
+
+    def column(self, name):
+        """Live view of the first `size` rows of a column"""
+        return getattr(self, name)[:self.size]
+
+    def income_mask(self):
+        """Per-row bool mask of income transactions (type compared case-insensitively)"""
+        lut = np.array([str(t).lower() == "income" for t in self.types.values] or [False])
+        return lut[self.column("type")]
+
+    def upsert(self, doc_id, data):
+        """Insert or overwrite one transaction; rewriting identical values is a no-op"""
+        row = self._row_of.get(doc_id)
+        if row is not None and self._unchanged(row, data):
+            self._advance(data.get("createdAt"))
+            return
+        if row is None:
+            if self.size == len(self.amount):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.ids.append(doc_id)
+            self.descriptions.append("")
+            self._row_of[doc_id] = row
+        else:
+            self.aggregates.remove(doc_id, *self._cell_values(row))
+            self._unindex(row)
+            self._fingerprint(row, -1)
+        self.amount[row] = to_cents(data.get("amount", 0))
+        self.day[row] = day_ordinal(data.get("date"))
+        self.category[row] = self.categories.encode(data.get("category", "uncategorized"))
+        self.type[row] = self.types.encode(data.get("type", ""))
+        self.user[row] = self.users.encode(data.get("userId", "unknown"))
+        self.descriptions[row] = str(data.get("description") or "")
+        self.aggregates.add(doc_id, *self._cell_values(row))
+        self.search.add(int(self.user[row]), doc_id, self.descriptions[row], self.categories.values[self.category[row]])
+        self._fingerprint(row, 1)
+        self._advance(data.get("createdAt"))
+        self.version = next(_versions)
+
+    def _unchanged(self, row, data) -> bool:
+        """Whether `data` would store exactly what the row already holds (e.g. a delta re-read)"""
+        return (self.amount[row] == to_cents(data.get("amount", 0))
+                and self.day[row] == day_ordinal(data.get("date"))
+                and self.category[row] == self.categories.lookup(data.get("category", "uncategorized"))
+                and self.type[row] == self.types.lookup(data.get("type", ""))
+                and self.user[row] == self.users.lookup(data.get("userId", "unknown"))
+                and self.descriptions[row] == str(data.get("description") or ""))
+
+    def _advance(self, created):
+        if created is not None and (self.high_water is None or created > self.high_water):
+            self.high_water = created
+
+    def remove(self, doc_id):
+        row = self._row_of.pop(doc_id, None)
+        if row is None:
+            return False
+        self.aggregates.remove(doc_id, *self._cell_values(row))
+        self._unindex(row)
+        self._fingerprint(row, -1)
+        last = self.size - 1
+        if row != last:
+            for col in self._columns():
+                col[row] = col[last]
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self.descriptions[row] = self.descriptions[last]
+            self._row_of[moved] = row
+        self.ids.pop()
+        self.descriptions.pop()
+        self.size = last
+        self.version = next(_versions)
+        return True
+
+    def row_of(self, doc_id):
+        """Row of a document. A store loaded from a snapshot file binary-searches the
+        file's sorted id index instead of building the dict, which only writes need.
+        """
+        rows = self._rows
+        if rows is not None or self._id_index is None:
+            return self._row_of[doc_id]
+        ids, order = self._id_index
+        key = str(doc_id).encode("utf-8")
+        i = int(np.searchsorted(ids, key))
+        if i < len(ids) and ids[i] == key:
+            return int(order[i])
+        raise KeyError(doc_id)
+
+    def id_index(self):
+        """(doc ids as UTF-8 bytes in sorted order, the row of each) for row_of() without the dict"""
+        ids = np.array([str(doc_id).encode("utf-8") for doc_id in self.ids], dtype=bytes)
+        if not len(ids):
+            ids = np.zeros(0, dtype="S1")
+        order = np.argsort(ids, kind="stable")
+        return ids[order], order.astype(np.int64)
+
+    def _cell_values(self, row):
+        """(user, category, type, amount, day) of a row, as RunningAggregates takes them"""
+        return (int(self.user[row]), int(self.category[row]), int(self.type[row]),
+                int(self.amount[row]), int(self.day[row]))
+
+    def _digest(self, row) -> int:
+        return row_digest(self.ids[row], self.amount[row], self.day[row], self.categories.values[self.category[row]],
+                          self.types.values[self.type[row]], self.users.values[self.user[row]], self.descriptions[row])
+
+    def _fingerprint(self, row, sign):
+        self.fingerprint = (self.fingerprint + sign * self._digest(row)) % FINGERPRINT_MOD
+
+    def _unindex(self, row):
+        self.search.remove(int(self.user[row]), self.ids[row], self.descriptions[row],
+                           self.categories.values[self.category[row]])
+
+    def replace_all(self, items):
+        """Reset the store from a full (doc_id, data) listing"""
+        self._reset(max(len(self.amount), self.INITIAL_CAPACITY))
+        self.high_water = None
+        for doc_id, data in items:
+            self.upsert(doc_id, data)
+        self.last_full_sync = self.last_checked = time.time()
+        self.version = next(_versions)
+
+    def row(self, i) -> dict:
+        return {
+            "amount": from_cents(self.amount[i]),
+            "category": self.categories.values[self.category[i]],
+            "type": self.types.values[self.type[i]],
+            "userId": self.users.values[self.user[i]],
+            "date": ordinal_to_iso(self.day[i]),
+            "description": self.descriptions[i],
+        }
+
+    def transactions(self) -> list:
+        """Materialize rows as dicts (only for callers that still need them)"""
+        return [self.row(i) for i in range(self.size)]
+
+    def derived(self, name, compute):
+        """Value computed from this store, recomputed only after the store changes"""
+        cached = self._derived.get(name)
+        if cached is None or cached[0] != self.version:
+            cached = self._derived[name] = (self.version, compute(self))
+        return cached[1]
+
+    def copy(self):
+        """Independent copy, so a writer can change it while readers keep the original"""
+        clone = TransactionStore.__new__(TransactionStore)
+        for name in COLUMNS:
+            setattr(clone, name, np.array(getattr(self, name)))  # plain writable arrays, even from a memory map
+        for name in ("categories", "types", "users"):
+            vocab = getattr(self, name)
+            copied = Vocabulary()
+            copied.values, copied.codes = list(vocab.values), dict(vocab.codes)
+            setattr(clone, name, copied)
+        clone.ids = list(self.ids)
+        clone.descriptions = list(self.descriptions)
+        clone._rows = dict(self._rows) if self._rows is not None else None
+        clone._id_index = None  # the copy is for writing, which moves rows; it builds the dict instead
+        clone.size = self.size
+        clone.aggregates = self.aggregates.copy()
+        clone.search = self.search.copy()
+        clone.high_water = self.high_water
+        clone.version = self.version
+        clone.fingerprint = self.fingerprint
+        clone.last_full_sync = self.last_full_sync
+        clone.last_checked = self.last_checked
+        clone._derived = {}
+        clone._nbytes = None
+        return clone
+
+    def _grow(self):
+        capacity = max(len(self.amount) * 2, self.INITIAL_CAPACITY)
+        for name in COLUMNS:
+            col = getattr(self, name)
+            grown = np.zeros(capacity, dtype=col.dtype)
+            grown[:self.size] = col[:self.size]
+            setattr(self, name, grown)
+
+    @classmethod
+    def from_columns(cls, ids, columns, categories=(), types=(), users=(), descriptions=None, copy=True,
+                     fingerprint=None, aggregates=None, id_index=None):
+        """Build a store directly from column arrays and their vocabularies.
+
+        With copy=False the arrays are used as they are (e.g. read-only memory
+        maps), which is fine for a store that is only ever published; copy()
+        gives writers private arrays. A `fingerprint`, `aggregates` arrays
+        (RunningAggregates.packed()) and an `id_index` (id_index()) saved with
+        the columns skip hashing, grouping and indexing every row again.
+        """
+        store = cls(capacity=max(len(ids), cls.INITIAL_CAPACITY) if copy else 0)
+        store.size = len(ids)
+        for name in COLUMNS:
+            if copy:
+                getattr(store, name)[:store.size] = columns[name]
+            else:
+                setattr(store, name, columns[name])
+        store.categories = Vocabulary(categories)
+        store.types = Vocabulary(types)
+        store.users = Vocabulary(users)
+        store.ids = list(ids)
+        store.descriptions = list(descriptions) if descriptions is not None else [""] * store.size
+        store._rows = None
+        store._id_index = id_index
+        if aggregates is not None:
+            store.aggregates = RunningAggregates.from_packed(store.ids, store.column("day"), aggregates)
+        else:
+            store.aggregates = RunningAggregates.from_columns(store.ids, {name: store.column(name) for name in COLUMNS})
+        if fingerprint is None:
+            fingerprint = sum(store._digest(row) for row in range(store.size))
+        store.fingerprint = fingerprint % FINGERPRINT_MOD
+        store.last_full_sync = store.last_checked = time.time()
+        return store
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        """Build a store from plain dicts that have no document ids (sample data)"""
+        store = cls()
+        store.replace_all((str(i), t) for i, t in enumerate(transactions))
+        return store
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """One published, read-only state of a scope's transactions.
+
+    Writers never change a store once it is in a Snapshot: they build the next
+    store (fresh, or via copy()) off to the side and publish a new Snapshot by
+    swapping a single reference, so readers take no locks and never see a
+    half-applied refresh.
+    """
+    store: TransactionStore
+    refreshed_at: float = None
+
+    @classmethod
+    def publish(cls, store, refreshed_at=None):
+        store.aggregates.settle(store)  # repair removal damage now, so readers only read
+        return cls(store, time.time() if refreshed_at is None else refreshed_at)
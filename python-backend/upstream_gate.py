@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class UpstreamBusy(Exception):
+    """The gate could not admit a call before its deadline; retry after `retry_after` seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to a burst of one minute's worth"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount) -> float:
+        """Seconds until `amount` units are available (0 if they are now); call refill first"""
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+
+class UpstreamGate:
+    """Process-wide admission control in front of Gemini.
+
+    A call must get a request token (RPM bucket), its estimated tokens (TPM
+    bucket) and one of `max_in_flight` slots. Up to `max_queue` callers may
+    wait for those, each until its own deadline; anyone beyond that is
+    rejected straight away with UpstreamBusy instead of piling up threads.
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, rpm=60, tpm=1_000_000, max_in_flight=8, max_queue=32, queue_timeout=10.0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @contextmanager
+    def slot(self, tokens=0):
+        """Hold an upstream slot for the duration of the block"""
+        self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, tokens=0):
+        deadline = time.monotonic() + self.queue_timeout
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise UpstreamBusy("Upstream queue is full", self._retry_after())
+            self.waiting += 1
+        try:
+            self._wait_for(tokens, deadline)
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._refund(tokens)
+                self._timed_out()
+                raise UpstreamBusy("Too many upstream calls in flight", self._retry_after())
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+
+    def charge(self, tokens=0):
+        """Take another request (and `tokens`) for a retry made inside an admitted call.
+
+        A retried request counts against the upstream's limits just like a new
+        one, so it waits for the buckets too (up to queue_timeout).
+        """
+        self._wait_for(tokens, time.monotonic() + self.queue_timeout)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
+
+    def _wait_for(self, tokens, deadline):
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                self._timed_out()
+                raise UpstreamBusy("Upstream rate limit reached", wait)
+            time.sleep(wait)
+
+    def _take(self, tokens) -> float:
+        """Take one request and `tokens` from the buckets, or return how long to wait for both"""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amount))
+            if wait:
+                return wait
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.tokens -= min(amount, bucket.capacity)
+            return 0.0
+
+    def _refund(self, tokens):
+        with self._lock:
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + min(amount, bucket.capacity))
+
+    def _timed_out(self):
+        with self._lock:
+            self.timed_out += 1
+
+    def _retry_after(self) -> float:
+        """Best guess at when a slot or request token frees up"""
+        if self.requests is not None:
+            return max(1.0, 1 / self.requests.rate)
+        return 1.0